@@ -0,0 +1,325 @@
+# alphabeta.py
+"""
+Iterative-deepening alpha-beta (negamax) search over Board, without any network.
+
+Positions are scored by material (Piece.point, in hundredths) from the side
+to move's point of view; losing the king scores -MATE. The search uses a
+fixed-size transposition table indexed by hash & mask, orders moves by
+TT move, MVV-LVA captures, killer moves and the history heuristic, and
+resolves captures with a quiescence search at the horizon.
+"""
+import time
+
+from piece import King
+
+INFINITY = 1000000
+MATE = 100000
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Victim value for MVV-LVA: capturing the king ends the game
+_KING_VICTIM = 1000
+_CHECK_INTERVAL = 1023  # Check the clock every 1024 nodes
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results, one entry per slot (hash & mask).
+
+    An entry from the current search is only replaced by a result of at least
+    the same depth; entries left over from earlier searches are always replaced.
+    """
+    def __init__(self, size_bits=20):
+        """
+        :param size_bits: The table has 2 ** size_bits slots.
+        """
+        self.size = 1 << size_bits
+        self.mask = self.size - 1
+        self.keys = [-1] * self.size
+        self.depths = [0] * self.size
+        self.scores = [0] * self.size
+        self.flags = [EXACT] * self.size
+        self.moves = [-1] * self.size
+        self.ages = [0] * self.size
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        """Age the existing entries so they can be replaced freely."""
+        self.age += 1
+
+    def clear(self):
+        self.keys = [-1] * self.size
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """:return: The slot holding `key`, or None."""
+        self.probes += 1
+        slot = key & self.mask
+        if self.keys[slot] == key:
+            self.hits += 1
+            return slot
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        slot = key & self.mask
+        if self.keys[slot] != key and self.ages[slot] == self.age and self.depths[slot] > depth:
+            return
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.scores[slot] = score
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+
+class AlphaBeta:
+    def __init__(self, tt_bits=20, max_depth=64):
+        """
+        :param tt_bits: Transposition table size, 2 ** tt_bits entries.
+        :param max_depth: Deepest iteration of iterative deepening.
+        """
+        self.tt = TranspositionTable(tt_bits)
+        self.max_depth = max_depth
+        self.history = [0] * 4096
+        self.killers = [[-1, -1] for _ in range(max_depth + 64)]
+        self.nodes = 0
+        self.stopped = False
+        self.last_stats = {}
+
+    def evaluate(self, board):
+        """Material balance in hundredths of a Piece.point, for the side to move."""
+        balance = board.material["white"] - board.material["black"]
+        return 100 * (balance if board.white_turn else -balance)
+
+    def search(self, board, depth=None, time_limit=None, should_stop=None, verbose=False):
+        """
+        Search the board's position with iterative deepening.
+
+        :param board: The Board to search (side to move is board.white_turn); left unchanged.
+        :param depth: Deepest iteration (default max_depth, or 4 without a time_limit).
+        :param time_limit: Stop after this many seconds; the last completed iteration's move is returned.
+        :param should_stop: Optional callable; the search stops as soon as it returns True.
+        :param verbose: Print a line per completed depth.
+        :return: The chosen move ((start_row, start_col), (end_row, end_col)), or None without legal moves.
+        """
+        if depth is None:
+            depth = self.max_depth if time_limit is not None else 4
+        depth = min(depth, self.max_depth)
+        self.board = board
+        self.should_stop = should_stop
+        self.stopped = False
+        self.start = time.perf_counter()
+        self.deadline = self.start + time_limit if time_limit is not None else None
+        self.nodes = 0
+        self.tt.new_search()
+        self.history = [value // 8 for value in self.history]
+        for killers in self.killers:
+            killers[0] = killers[1] = -1
+
+        best_move, best_score = None, 0
+        iterations = []
+        previous_nodes = 0
+        for current in range(1, depth + 1):
+            nodes_before, probes_before, hits_before = self.nodes, self.tt.probes, self.tt.hits
+            self.root_move = None
+            score = self._negamax(current, -INFINITY, INFINITY, 0)
+            if self.stopped and iterations:
+                break  # Keep the last complete iteration
+            if self.root_move is None:
+                break  # No legal moves
+            best_move, best_score = self.root_move, score
+            if self.stopped:
+                break
+
+            seconds = time.perf_counter() - self.start
+            nodes = self.nodes - nodes_before
+            probes = self.tt.probes - probes_before
+            iteration = {
+                "depth": current,
+                "score": score,
+                "move": best_move,
+                "nodes": nodes,
+                "seconds": seconds,
+                "nodes_per_sec": self.nodes / seconds if seconds > 0 else 0.0,
+                "tt_hit_rate": (self.tt.hits - hits_before) / probes if probes else 0.0,
+                "branching_factor": nodes / previous_nodes if previous_nodes else float(nodes),
+            }
+            iterations.append(iteration)
+            previous_nodes = nodes
+            if verbose:
+                print(f"depth {current} score {score} move {best_move} nodes {nodes} "
+                      f"{iteration['nodes_per_sec']:.0f} nps, TT hits {iteration['tt_hit_rate']:.1%}, "
+                      f"EBF {iteration['branching_factor']:.2f}")
+            if abs(score) >= MATE - self.max_depth - 64:
+                break  # Forced king capture found
+
+        seconds = time.perf_counter() - self.start
+        self.last_stats = {
+            "depth": iterations[-1]["depth"] if iterations else 0,
+            "score": best_score,
+            "nodes": self.nodes,
+            "seconds": seconds,
+            "nodes_per_sec": self.nodes / seconds if seconds > 0 else 0.0,
+            "tt_hit_rate": self.tt.hit_rate(),
+            "iterations": iterations,
+        }
+        self.board = None
+        return best_move
+
+    def _check_time(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        elif self.should_stop is not None and self.should_stop():
+            self.stopped = True
+
+    def _order_moves(self, moves, tt_move, ply):
+        """Sort moves: TT move, MVV-LVA captures, killers, then history; self-captures and null moves last."""
+        board = self.board.board
+        enemy_bb = self.board.black_bb if self.board.white_turn else self.board.white_bb
+        killers = self.killers[ply]
+        scored = []
+        for move in moves:
+            (start_row, start_col), (end_row, end_col) = move
+            start, end = start_row * 8 + start_col, end_row * 8 + end_col
+            index = start * 64 + end
+            if index == tt_move:
+                score = 1 << 30
+            elif enemy_bb >> end & 1:
+                victim = board[end_row][end_col]
+                value = _KING_VICTIM if isinstance(victim, King) else victim.point
+                score = (1 << 20) + 16 * value - board[start_row][start_col].point
+            elif start == end or board[end_row][end_col] is not None:
+                score = -(1 << 20)  # Rook null move or a knight landing on its own piece
+            elif index == killers[0]:
+                score = (1 << 19) + 1
+            elif index == killers[1]:
+                score = 1 << 19
+            else:
+                score = self.history[index]
+            scored.append((score, index, move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+    def _negamax(self, depth, alpha, beta, ply):
+        board = self.board
+        self.nodes += 1
+        if not self.nodes & _CHECK_INTERVAL:
+            self._check_time()
+        if self.stopped:
+            return 0
+        if board.is_game_over():
+            return _terminal_score(board, ply)
+        if ply and board.position_counts.get(board.hash, 0) > 1:
+            return 0  # Repetition
+        if depth <= 0:
+            return self._quiesce(alpha, beta, ply)
+
+        tt = self.tt
+        key = board.hash
+        tt_move = -1
+        slot = tt.probe(key)
+        if slot is not None:
+            tt_move = tt.moves[slot]
+            if ply and tt.depths[slot] >= depth:
+                score = _score_from_tt(tt.scores[slot], ply)
+                flag = tt.flags[slot]
+                if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                    return score
+
+        moves = board.get_all_legal_moves("white" if board.white_turn else "black")
+        if not moves:
+            return 0
+
+        original_alpha = alpha
+        best_score, best_index = -INFINITY, -1
+        for order_score, index, move in self._order_moves(moves, tt_move, ply):
+            captured = board.apply_move(*move)
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.undo_move()
+            if self.stopped:
+                return 0
+            if score > best_score:
+                best_score, best_index = score, index
+                if ply == 0:
+                    self.root_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if captured is None:
+                            killers = self.killers[ply]
+                            if killers[0] != index:
+                                killers[1] = killers[0]
+                                killers[0] = index
+                            self.history[index] += depth * depth
+                        break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        tt.store(key, depth, _score_to_tt(best_score, ply), flag, best_index)
+        return best_score
+
+    def _quiesce(self, alpha, beta, ply):
+        """Search captures of enemy pieces only until the position is quiet."""
+        board = self.board
+        self.nodes += 1
+        if not self.nodes & _CHECK_INTERVAL:
+            self._check_time()
+        if self.stopped:
+            return 0
+        if board.is_game_over():
+            return _terminal_score(board, ply)
+
+        stand_pat = self.evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        white = board.white_turn
+        enemy_bb = board.black_bb if white else board.white_bb
+        captures = [move for move in board.get_all_legal_moves("white" if white else "black")
+                    if enemy_bb >> (move[1][0] * 8 + move[1][1]) & 1]
+        for order_score, index, move in self._order_moves(captures, -1, ply):
+            board.apply_move(*move)
+            score = -self._quiesce(-beta, -alpha, ply + 1)
+            board.undo_move()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+
+def _terminal_score(board, ply):
+    # Usually the side to move has just lost its king, but a knight may also land on its own king
+    if board.king_squares["white" if board.white_turn else "black"] is None:
+        return -MATE + ply
+    return MATE - ply
+
+
+def _score_to_tt(score, ply):
+    # Store mate scores relative to the node, not the root
+    if score > MATE - 1000:
+        return score + ply
+    if score < -MATE + 1000:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score > MATE - 1000:
+        return score - ply
+    if score < -MATE + 1000:
+        return score + ply
+    return score
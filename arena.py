@@ -0,0 +1,304 @@
+# arena.py
+"""
+Model-vs-model evaluation: plays two checkpoints against each other.
+
+Games come in pairs that share a random opening (a few random plies) with the
+colors swapped, so neither model profits from the opening or from moving
+first. Each model gets one InferenceServer in this process that batches the
+positions from every worker process. With --sprt the match ends as soon as a
+sequential probability ratio test accepts or rejects the Elo hypothesis.
+
+Usage:
+    python arena.py new.pth trained_chess_model.pth --games 200 --sprt
+"""
+import argparse
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+import torch
+
+import constants
+from board import Board
+from book import load_book
+from encoder import board_to_codes, select_legal_move
+from eval_cache import EvalCache
+from inference import InferenceServer, LocalInference
+from mcts import MCTS
+from model import BACKENDS, load_model
+
+# Per-process evaluators (model A, model B), set up by _init_worker
+_worker_evaluators = None
+_worker_settings = None
+
+
+def play_match_game(evaluators, game, opening_plies=8, max_plies=constants.MAX_GAME_PLIES, mcts_nodes=0,
+                    seed=0, book=None):
+    """
+    Play one arena game.
+
+    :param evaluators: (evaluator of model A, evaluator of model B), see inference.py.
+    :param game: Game number; model A plays white in even games. Games 2k and 2k + 1 share an opening.
+    :param opening_plies: Random legal moves played before the models take over.
+    :param book: Optional OpeningBook or path of one (see book.py). Opening moves are then drawn from
+                 it in proportion to how often they were played, and random legal moves are only
+                 played once the game leaves the book.
+    :param max_plies: The game is a draw after this many plies.
+    :param mcts_nodes: MCTS simulations per move (see mcts.py); 0 plays each policy's choice directly.
+    :param seed: Match seed for the openings.
+    :return: The result for model A: 1 win, 0.5 draw, 0 loss.
+    """
+    rng = random.Random(seed * 1000003 + game // 2)
+    if isinstance(book, str):
+        book = load_book(book)
+    a_color = "white" if game % 2 == 0 else "black"
+    engines = [MCTS(evaluator) for evaluator in evaluators] if mcts_nodes else None
+    board = Board()
+    plies = 0
+
+    while not board.is_game_over() and plies < max_plies:
+        color = "white" if board.white_turn else "black"
+        player = 0 if color == a_color else 1
+        legal_moves = board.get_all_legal_moves(color)
+        if not legal_moves:
+            break
+
+        if plies < opening_plies:
+            move = book.choose(board, rng) if book is not None else None
+            if move is None:
+                move = rng.choice(legal_moves)
+        elif engines is not None:
+            move = engines[player].search(board, nodes=mcts_nodes)
+        else:
+            # Like self-play, avoid moves that repeat a position of this game
+            candidates = [move for move in legal_moves if not board.repetition_count(board.hash_after(*move))]
+            if not candidates:
+                break
+            output = evaluators[player].evaluate(board_to_codes(board)).unsqueeze(0)
+            move = candidates[select_legal_move(output, candidates)]
+        board.apply_move(*move)
+        plies += 1
+
+    if board.king_squares["white"] is None:
+        return 1.0 if a_color == "black" else 0.0
+    if board.king_squares["black"] is None:
+        return 1.0 if a_color == "white" else 0.0
+    return 0.5
+
+
+def elo_from_score(score):
+    """Elo difference corresponding to an expected score."""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_from_elo(elo):
+    """Expected score corresponding to an Elo difference."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def match_stats(wins, draws, losses):
+    """
+    Summarize a match from model A's point of view.
+
+    :return: A dict with the score, the Elo difference, the 95% confidence interval of the
+             Elo difference as (low, high), and the per-game score variance.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return {"score": 0.5, "elo": 0.0, "elo_ci": (-math.inf, math.inf), "variance": 0.0}
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return {
+        "score": score,
+        "elo": elo_from_score(score),
+        "elo_ci": (elo_from_score(score - margin), elo_from_score(score + margin)),
+        "variance": variance,
+    }
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """
+    Log-likelihood ratio of H1 (Elo difference elo1) against H0 (elo0).
+
+    Uses the normal approximation of the game score distribution (the GSPRT
+    used by engine testing frameworks), so draws are handled without a draw model.
+    """
+    games = wins + draws + losses
+    stats = match_stats(wins, draws, losses)
+    if games == 0 or stats["variance"] == 0:
+        return 0.0
+    score0, score1 = score_from_elo(elo0), score_from_elo(elo1)
+    return (score1 - score0) * (2 * stats["score"] - score0 - score1) * games / (2 * stats["variance"])
+
+
+def sprt_bounds(alpha=0.05, beta=0.05):
+    """:return: (lower, upper) LLR bounds; below lower accepts H0, above upper accepts H1."""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def _init_worker(clients, next_client, settings):
+    global _worker_evaluators, _worker_settings
+    torch.set_num_threads(1)
+    with next_client.get_lock():
+        _worker_evaluators = clients[next_client.value]
+        next_client.value += 1
+    _worker_settings = settings
+
+
+def _play_task(game):
+    return game, play_match_game(_worker_evaluators, game, **_worker_settings)
+
+
+def run_match(model_a, model_b, games, workers=constants.SELF_PLAY_WORKERS, opening_plies=8,
+              max_plies=constants.MAX_GAME_PLIES, mcts_nodes=0, seed=0, sprt=False, elo0=0.0, elo1=10.0,
+              alpha=0.05, beta=0.05, min_games=20, max_batch=64, max_wait=0.002,
+              eval_cache_size=constants.EVAL_CACHE_SIZE, book=constants.OPENING_BOOK, verbose=True):
+    """
+    Play a match between two models.
+
+    :param model_a: The ChessModel being evaluated.
+    :param model_b: The reference ChessModel.
+    :param games: Number of games (at most; fewer if the SPRT stops the match early).
+    :param workers: Number of worker processes, None for one per CPU core. With 1 the games
+                    are played in the current process.
+    :param opening_plies: Random plies at the start of every pair of games.
+    :param book: Path of an opening book the random openings are drawn from, or None.
+    :param max_plies: Games are drawn after this many plies.
+    :param mcts_nodes: MCTS simulations per move; 0 plays each policy's choice directly.
+    :param seed: Seed for the openings.
+    :param sprt: Stop as soon as the SPRT of elo0 against elo1 is decided.
+    :param alpha: SPRT false positive rate.
+    :param beta: SPRT false negative rate.
+    :param min_games: Games before the SPRT may stop the match; the score variance is unreliable before.
+    :param max_batch: InferenceServer batch size limit.
+    :param max_wait: InferenceServer batching deadline in seconds.
+    :param eval_cache_size: Entries of each model's EvalCache (shared by the workers), 0 for none.
+    :param verbose: Print the running score.
+    :return: A dict with wins, draws and losses of model A, the games played, match_stats,
+             games/sec, the SPRT outcome ("H0", "H1" or None) with its final LLR and the
+             EvalCache stats of both models ('eval_cache').
+    """
+    workers = workers or multiprocessing.cpu_count()
+    settings = {"opening_plies": opening_plies, "max_plies": max_plies, "mcts_nodes": mcts_nodes, "seed": seed,
+                "book": book}
+    results = {1.0: 0, 0.5: 0, 0.0: 0}
+    lower, upper = sprt_bounds(alpha, beta)
+    decision, llr = None, 0.0
+    start = time.perf_counter()
+
+    def record(game, result):
+        nonlocal decision, llr
+        results[result] += 1
+        played = sum(results.values())
+        if sprt and played >= min_games:
+            llr = sprt_llr(results[1.0], results[0.5], results[0.0], elo0, elo1)
+            if llr <= lower:
+                decision = "H0"
+            elif llr >= upper:
+                decision = "H1"
+        if verbose and (played % 10 == 0 or decision is not None or played == games):
+            stats = match_stats(results[1.0], results[0.5], results[0.0])
+            print(f"Game {played}/{games}: +{results[1.0]} ={results[0.5]} -{results[0.0]}, "
+                  f"Elo {stats['elo']:+.0f}" + (f", LLR {llr:.2f} [{lower:.2f}, {upper:.2f}]" if sprt else ""))
+        return decision is not None
+
+    # One cache per model, since each holds the outputs of a single model version
+    caches = [EvalCache(eval_cache_size, top_k=constants.EVAL_CACHE_TOP_K, shared=workers > 1)
+              for _ in range(2)] if eval_cache_size else [None, None]
+    if workers == 1:
+        evaluators = (LocalInference(model_a, caches[0]), LocalInference(model_b, caches[1]))
+        for game in range(games):
+            if record(game, play_match_game(evaluators, game, **settings)):
+                break
+    else:
+        servers = [InferenceServer(model, max_batch=max_batch, max_wait=max_wait, cache=cache)
+                   for model, cache in zip((model_a, model_b), caches)]
+        clients = list(zip(*(server.create_clients(workers) for server in servers)))
+        next_client = multiprocessing.Value("i", 0)
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(clients, next_client, settings))
+        try:
+            # Start the server threads only after the workers have been forked
+            for server in servers:
+                server.start()
+            for game, result in pool.imap_unordered(_play_task, range(games)):
+                if record(game, result):
+                    break
+        finally:
+            # Workers may be blocked on the servers, so stop them before the servers
+            pool.terminate()
+            pool.join()
+            for server in servers:
+                server.stop()
+    cache_stats = [cache.stats() if cache is not None else None for cache in caches]
+    for cache in caches:
+        if cache is not None:
+            cache.close()
+
+    played = sum(results.values())
+    seconds = time.perf_counter() - start
+    summary = {
+        "wins": results[1.0],
+        "draws": results[0.5],
+        "losses": results[0.0],
+        "games": played,
+        "seconds": seconds,
+        "games_per_sec": played / seconds if seconds > 0 else 0.0,
+        "sprt": decision,
+        "llr": llr,
+        "eval_cache": cache_stats,
+    }
+    summary.update(match_stats(results[1.0], results[0.5], results[0.0]))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two model checkpoints against each other.")
+    parser.add_argument("model_a", help="Checkpoint being evaluated.")
+    parser.add_argument("model_b", help="Reference checkpoint.")
+    parser.add_argument("--games", type=int, default=100, help="Number of games (default: 100).")
+    parser.add_argument("--workers", type=int, default=constants.SELF_PLAY_WORKERS,
+                        help="Worker processes (default: one per CPU core).")
+    parser.add_argument("--opening-plies", type=int, default=8, help="Random plies per opening (default: 8).")
+    parser.add_argument("--book", default=constants.OPENING_BOOK, help="Opening book to draw the openings from.")
+    parser.add_argument("--max-plies", type=int, default=constants.MAX_GAME_PLIES)
+    parser.add_argument("--mcts-nodes", type=int, default=0,
+                        help="MCTS simulations per move; 0 plays the policy's choice (default: 0).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--backend", choices=BACKENDS, default=constants.MODEL_BACKEND,
+                        help="Inference backend of both models (default: %(default)s).")
+    parser.add_argument("--logits", action="store_true", help="Skip the models' softmax.")
+    parser.add_argument("--sprt", action="store_true", help="Stop early once the SPRT is decided.")
+    parser.add_argument("--elo0", type=float, default=0.0, help="SPRT null hypothesis Elo (default: 0).")
+    parser.add_argument("--elo1", type=float, default=10.0, help="SPRT alternative hypothesis Elo (default: 10).")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--min-games", type=int, default=20, help="Games before the SPRT may stop (default: 20).")
+    args = parser.parse_args(argv)
+
+    model_a = load_model(args.model_a, args.device, args.backend, args.logits)
+    model_b = load_model(args.model_b, args.device, args.backend, args.logits)
+    summary = run_match(model_a, model_b, args.games, workers=args.workers, opening_plies=args.opening_plies,
+                        max_plies=args.max_plies, mcts_nodes=args.mcts_nodes, seed=args.seed, sprt=args.sprt,
+                        elo0=args.elo0, elo1=args.elo1, alpha=args.alpha, beta=args.beta,
+                        min_games=args.min_games, book=args.book)
+
+    low, high = summary["elo_ci"]
+    print(f"{args.model_a} vs {args.model_b}: +{summary['wins']} ={summary['draws']} -{summary['losses']} "
+          f"in {summary['games']} games")
+    print(f"Score {summary['score']:.3f}, Elo {summary['elo']:+.1f} (95% CI {low:+.1f} to {high:+.1f})")
+    print(f"{summary['games_per_sec']:.2f} games/s over {summary['seconds']:.1f}s")
+    if args.sprt:
+        outcome = {"H0": f"H0 accepted (not better than {args.elo0:+.0f} Elo)",
+                   "H1": f"H1 accepted (at least {args.elo1:+.0f} Elo)",
+                   None: "inconclusive"}[summary["sprt"]]
+        print(f"SPRT: {outcome}, LLR {summary['llr']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# bench_model.py
+"""
+CPU benchmark of the model inference backends (see model.BACKENDS).
+
+For every backend it reports the single-position latency, the throughput of
+batched forward passes and how often its move choice (the legal-move argmax)
+agrees with the first backend measured (eager by default), on positions from
+random games.
+
+Usage:
+    python bench_model.py                              # random weights
+    python bench_model.py --model trained_chess_model.pth --batch 256
+    python bench_model.py --backends eager int8 --logits
+"""
+import argparse
+import random
+import sys
+import time
+
+import torch
+
+from board import Board
+from encoder import board_to_codes, encode_boards, legal_move_masks, masked_argmax
+from model import BACKENDS, ChessModel, optimize_model
+
+
+def sample_positions(count, seed=0, max_plies=80):
+    """
+    Positions from random games.
+
+    :return: A tuple (list of piece-code arrays, list of legal move lists).
+    """
+    rng = random.Random(seed)
+    codes, legal = [], []
+    while len(codes) < count:
+        board = Board()
+        for _ in range(rng.randrange(max_plies)):
+            moves = board.get_all_legal_moves("white" if board.white_turn else "black")
+            if not moves or board.is_game_over():
+                break
+            board.apply_move(*rng.choice(moves))
+        moves = board.get_all_legal_moves("white" if board.white_turn else "black")
+        if moves and not board.is_game_over():
+            codes.append(board_to_codes(board))
+            legal.append(moves)
+    return codes, legal
+
+
+def _time_calls(model, inputs, repeats):
+    times = []
+    with torch.no_grad():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(inputs)
+            times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def benchmark(model, backend, inputs, masks, reference=None, batch=256, repeats=50, warmup=5):
+    """
+    Measure one backend.
+
+    :param model: Evaluation-mode float ChessModel; a copy is converted to `backend`.
+    :param inputs: (N, 12, 8, 8) encoded positions, N >= batch.
+    :param masks: (N, 4096) legal-move masks.
+    :param reference: Move choices of another backend to compare against, or None.
+    :return: A dict with build seconds, latency mean and p99 (ms), batch positions/sec,
+             the move choices and their agreement with `reference`.
+    """
+    start = time.perf_counter()
+    fast = optimize_model(_copy(model), backend)
+    with torch.no_grad():
+        for _ in range(warmup):  # Triggers compilation / profiling runs
+            fast(inputs[:1])
+            fast(inputs[:batch])
+    build = time.perf_counter() - start
+
+    single = _time_calls(fast, inputs[:1], repeats)
+    batched = _time_calls(fast, inputs[:batch], max(1, repeats // 5))
+    with torch.no_grad():
+        moves = torch.cat([masked_argmax(fast(inputs[i:i + batch]), masks[i:i + batch])
+                           for i in range(0, len(inputs), batch)])
+    return {
+        "backend": backend,
+        "build": build,
+        "latency_ms": sum(single) / len(single) * 1000,
+        "p99_ms": single[min(len(single) - 1, int(0.99 * len(single)))] * 1000,
+        "positions_per_sec": batch / (sum(batched) / len(batched)),
+        "moves": moves,
+        "agreement": (moves == reference).float().mean().item() if reference is not None else 1.0,
+    }
+
+
+def _copy(model):
+    other = ChessModel(logits=model.logits)
+    other.load_state_dict(model.state_dict())
+    return other.eval()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the model inference backends on CPU.")
+    parser.add_argument("--model", help="Checkpoint to load (default: random weights).")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--logits", action="store_true", help="Skip the softmax in every backend.")
+    parser.add_argument("--positions", type=int, default=512, help="Positions for the agreement check.")
+    parser.add_argument("--batch", type=int, default=256, help="Batch size for throughput (default: 256).")
+    parser.add_argument("--repeats", type=int, default=50, help="Timed single-position calls (default: 50).")
+    parser.add_argument("--threads", type=int, help="torch intra-op threads (default: torch's choice).")
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = ChessModel(logits=args.logits)
+    if args.model:
+        model.load_state_dict(torch.load(args.model, map_location="cpu"))
+    model.eval()
+
+    codes, legal = sample_positions(max(args.positions, args.batch))
+    inputs = encode_boards(codes)
+    masks = legal_move_masks(legal)
+    print(f"{len(codes)} positions, batch {args.batch}, {torch.get_num_threads()} threads")
+    print(f"{'backend':<15}{'build s':>9}{'latency ms':>12}{'p99 ms':>9}{'positions/s':>13}{'same move':>11}")
+
+    reference = None
+    for backend in args.backends:
+        try:
+            result = benchmark(model, backend, inputs, masks, reference, args.batch, args.repeats)
+        except Exception as error:  # e.g. torch.compile without a working compiler
+            print(f"{backend:<15}failed: {error!r}"[:120])
+            continue
+        if reference is None:
+            reference = result["moves"]
+        print(f"{backend:<15}{result['build']:>9.2f}{result['latency_ms']:>12.3f}{result['p99_ms']:>9.3f}"
+              f"{result['positions_per_sec']:>13.0f}{result['agreement']:>11.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# bitboard.py
+"""
+Bitboard move generation for Board.
+
+Squares are numbered row * 8 + col, so bit 0 is the top-left square (row 0,
+col 0) and bit 63 the bottom-right one. Iterating set bits from least to most
+significant therefore visits squares in the same row-major order as the
+original square-by-square scan, which keeps the order of generated moves
+identical.
+
+The generator reproduces the move rules implemented by the classes in
+piece.py exactly, including their quirks:
+
+- Pawns push one or two squares and capture diagonally (no promotion or
+  en passant).
+- Rooks only move to empty squares along ranks and files and may "move" to
+  their own square; they never capture.
+- Knights jump to all eight L-squares regardless of what is on them.
+- Bishops slide diagonally and capture enemy pieces.
+- Queens move like rooks and capture like bishops.
+- Kings only capture enemy pieces on adjacent squares.
+"""
+
+# Map each piece symbol to a channel index, white pieces first
+PIECE_INDEX = {
+    'P': 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5,
+    'p': 6, 'n': 7, 'b': 8, 'r': 9, 'q': 10, 'k': 11,
+}
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+FULL = (1 << 64) - 1
+
+# Precomputed ((row, col), (row, col)) tuple for every square pair, so the
+# generator never has to build new tuples
+SQUARES = [(s >> 3, s & 7) for s in range(64)]
+MOVES = [[(SQUARES[s], SQUARES[t]) for t in range(64)] for s in range(64)]
+
+
+def _step_table(offsets):
+    table = []
+    for s in range(64):
+        row, col = s >> 3, s & 7
+        bb = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << (r * 8 + c)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table([(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                              (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = _step_table([(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                            (0, 1), (1, -1), (1, 0), (1, 1)])
+# White pawns move towards row 0, black pawns towards row 7
+WHITE_PAWN_ATTACKS = _step_table([(-1, -1), (-1, 1)])
+BLACK_PAWN_ATTACKS = _step_table([(1, -1), (1, 1)])
+
+# Rays grouped by whether they run towards higher (positive) or lower
+# (negative) square numbers; the nearest blocker is the lowest set bit of a
+# positive ray and the highest set bit of a negative one.
+_ROOK_POSITIVE = [(0, 1), (1, 0)]
+_ROOK_NEGATIVE = [(0, -1), (-1, 0)]
+_BISHOP_POSITIVE = [(1, 1), (1, -1)]
+_BISHOP_NEGATIVE = [(-1, -1), (-1, 1)]
+
+
+def _ray_table(direction):
+    dr, dc = direction
+    table = []
+    for s in range(64):
+        r, c = (s >> 3) + dr, (s & 7) + dc
+        bb = 0
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+
+ROOK_POSITIVE_RAYS = [_ray_table(d) for d in _ROOK_POSITIVE]
+ROOK_NEGATIVE_RAYS = [_ray_table(d) for d in _ROOK_NEGATIVE]
+BISHOP_POSITIVE_RAYS = [_ray_table(d) for d in _BISHOP_POSITIVE]
+BISHOP_NEGATIVE_RAYS = [_ray_table(d) for d in _BISHOP_NEGATIVE]
+
+
+def _slider_attacks(square, occupied, positive_rays, negative_rays):
+    """Squares attacked by a slider on `square`, up to and including the first blocker."""
+    attacks = 0
+    for rays in positive_rays:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            first = (blockers & -blockers).bit_length() - 1
+            ray ^= rays[first]
+        attacks |= ray
+    for rays in negative_rays:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            first = blockers.bit_length() - 1
+            ray ^= rays[first]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(square, occupied):
+    return _slider_attacks(square, occupied, ROOK_POSITIVE_RAYS, ROOK_NEGATIVE_RAYS)
+
+
+def bishop_attacks(square, occupied):
+    return _slider_attacks(square, occupied, BISHOP_POSITIVE_RAYS, BISHOP_NEGATIVE_RAYS)
+
+
+def square_bit(row, col):
+    return 1 << (row * 8 + col)
+
+
+def occupancy(squares):
+    """
+    Build the (white, black) occupancy bitboards from a 2D array of pieces.
+
+    :param squares: An 8x8 list of lists holding piece objects or None.
+    :return: A tuple (white, black) of 64-bit integers.
+    """
+    white = black = 0
+    for row in range(8):
+        for col in range(8):
+            piece = squares[row][col]
+            if piece is not None:
+                if piece.color == "white":
+                    white |= 1 << (row * 8 + col)
+                else:
+                    black |= 1 << (row * 8 + col)
+    return white, black
+
+
+def target_squares(kind, square, white, own, enemy):
+    """
+    Bitboard of squares the piece of the given kind on `square` may move to.
+
+    :param kind: One of PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING.
+    :param square: Square index (row * 8 + col) the piece stands on.
+    :param white: True if the piece is white.
+    :param own: Occupancy bitboard of the moving side.
+    :param enemy: Occupancy bitboard of the other side.
+    """
+    occupied = own | enemy
+    if kind == PAWN:
+        if white:
+            targets = WHITE_PAWN_ATTACKS[square] & enemy
+            if square >= 8:
+                push = square - 8
+                if not (occupied >> push) & 1:
+                    targets |= 1 << push
+                    if square >> 3 == 6 and not (occupied >> (push - 8)) & 1:
+                        targets |= 1 << (push - 8)
+        else:
+            targets = BLACK_PAWN_ATTACKS[square] & enemy
+            if square < 56:
+                push = square + 8
+                if not (occupied >> push) & 1:
+                    targets |= 1 << push
+                    if square >> 3 == 1 and not (occupied >> (push + 8)) & 1:
+                        targets |= 1 << (push + 8)
+        return targets
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[square]
+    if kind == BISHOP:
+        return bishop_attacks(square, occupied) & ~own
+    if kind == ROOK:
+        return (rook_attacks(square, occupied) & ~occupied) | (1 << square)
+    if kind == QUEEN:
+        return ((rook_attacks(square, occupied) & ~occupied) | (1 << square)
+                | (bishop_attacks(square, occupied) & enemy))
+    return KING_ATTACKS[square] & enemy
+
+
+def generate_moves(squares, own, enemy, white):
+    """
+    Generate all moves for one side.
+
+    :param squares: An 8x8 list of lists holding piece objects or None.
+    :param own: Occupancy bitboard of the side to move.
+    :param enemy: Occupancy bitboard of the other side.
+    :param white: True if the side to move is white.
+    :return: A list of ((start_row, start_col), (end_row, end_col)) tuples.
+    """
+    moves = []
+    append = moves.append
+    pieces = own
+    while pieces:
+        low = pieces & -pieces
+        pieces ^= low
+        square = low.bit_length() - 1
+        kind = PIECE_INDEX[squares[square >> 3][square & 7].symbol] % 6
+        targets = target_squares(kind, square, white, own, enemy)
+        row = MOVES[square]
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            append(row[low.bit_length() - 1])
+    return moves
@@ -1,14 +1,47 @@
 # board.py
 from piece import Pawn, Rook, Knight, Bishop, Queen, King
+import bitboard
+import zobrist
+
+BACKENDS = ("bitboard", "scan")
+
+PIECE_CLASSES = {
+    'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King,
+    'P': Pawn, 'N': Knight, 'B': Bishop, 'R': Rook, 'Q': Queen, 'K': King,
+}
+
+# Piece code per symbol kept in Board.codes, the same as encoder.PIECE_CODES (0 is an empty square)
+PIECE_CODES = {symbol: index + 1 for symbol, index in bitboard.PIECE_INDEX.items()}
 
 class Board:
-    def __init__(self):
+    def __init__(self, backend="bitboard", setup=True):
+        """
+        :param backend: Move generator used by get_all_legal_moves, either "bitboard"
+                        (precomputed attack tables) or "scan" (tries every square pair
+                        with Piece.move; slow, kept as a reference implementation).
+        :param setup: Start from the initial position; False leaves the board empty.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
         self.board = [[None for _ in range(8)] for _ in range(8)]
-        self.setup_board()
+        self.white_bb = 0  # Occupancy bitboards, bit (row * 8 + col)
+        self.black_bb = 0
+        # Kept up to date incrementally by _place, see recompute_state
+        self.king_squares = {"white": None, "black": None}
+        self.pieces = {"white": {}, "black": {}}  # (row, col) -> piece
+        self.material = {"white": 0, "black": 0}
+        self.codes = bytearray(64)  # Piece code per square, see PIECE_CODES
+        self._planes = None  # One-hot (12, 64) plane buffer, allocated by planes()
+        self._planes_view = None
+        self.hash = 0  # Zobrist hash of the position, see zobrist.py
+        self.position_counts = {}  # hash -> times reached in this game
         self.move_history = []
         self.white_turn = True
         self.white_castle_king_side = True
         self.black_castle_king_side = True
+        if setup:
+            self.setup_board()
 
     def to_string(self):
         """
@@ -22,11 +55,96 @@ class Board:
             state_str += "/"
         return state_str
 
+    def to_fen(self):
+        """
+        Forsyth-Edwards Notation of the position, readable by from_fen.
+        Only king-side castling is tracked; en passant is always "-".
+        """
+        ranks = []
+        for row in self.board:
+            rank, empty = "", 0
+            for piece in row:
+                if piece is None:
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += piece.symbol
+            ranks.append(rank + (str(empty) if empty else ""))
+        castling = ("K" if self.white_castle_king_side else "") + ("k" if self.black_castle_king_side else "")
+        return (f"{'/'.join(ranks)} {'w' if self.white_turn else 'b'} {castling or '-'} - 0 "
+                f"{len(self.move_history) // 2 + 1}")
+
+    @classmethod
+    def from_fen(cls, fen, backend="bitboard"):
+        """
+        Build a board from a Forsyth-Edwards Notation string.
+        Only the piece placement, side to move and king-side castling fields are used.
+
+        :param fen: FEN string, e.g. "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1".
+        :param backend: Move generator backend, see Board.__init__.
+        :return: A new Board instance.
+        """
+        fields = fen.split()
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError(f"Invalid FEN piece placement: {fields[0]}")
+
+        board = cls(backend, setup=False)
+        for row, rank in enumerate(ranks):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                else:
+                    if char not in PIECE_CLASSES or col > 7:
+                        raise ValueError(f"Invalid FEN rank: {rank}")
+                    board.board[row][col] = PIECE_CLASSES[char]("white" if char.isupper() else "black")
+                    col += 1
+            if col != 8:
+                raise ValueError(f"Invalid FEN rank: {rank}")
+
+        board.white_turn = len(fields) < 2 or fields[1] == "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        board.white_castle_king_side = "K" in castling
+        board.black_castle_king_side = "k" in castling
+        board.recompute_state()
+        return board
+
+    def copy(self):
+        """
+        Independent copy of the board, including its move history (so undo_move works on it).
+        Pieces are shared flyweights (see piece.py), so only the square grid and the small
+        incremental state are copied; no piece objects are cloned.
+        """
+        other = Board.__new__(Board)
+        other.backend = self.backend
+        other.board = [row[:] for row in self.board]
+        other.white_bb = self.white_bb
+        other.black_bb = self.black_bb
+        other.king_squares = self.king_squares.copy()
+        other.pieces = {"white": self.pieces["white"].copy(), "black": self.pieces["black"].copy()}
+        other.material = self.material.copy()
+        other.codes = self.codes[:]
+        other._planes = other._planes_view = None
+        if self._planes is not None:
+            other._set_planes(self._planes.copy())
+        other.hash = self.hash
+        other.position_counts = self.position_counts.copy()
+        other.move_history = self.move_history[:]
+        other.white_turn = self.white_turn
+        other.white_castle_king_side = self.white_castle_king_side
+        other.black_castle_king_side = self.black_castle_king_side
+        return other
+
     def is_game_over(self):
         # check if either king is missing
-        white_king_present = any(isinstance(piece, King) and piece.color == "white" for row in self.board for piece in row)
-        black_king_present = any(isinstance(piece, King) and piece.color == "black" for row in self.board for piece in row)
-        return not white_king_present or not black_king_present
+        return self.king_squares["white"] is None or self.king_squares["black"] is None
+
+    def get_material(self, color):
+        """Total Piece.point value of the given color's pieces still on the board."""
+        return self.material[color]
 
     def setup_board(self):
         # Place black pieces
@@ -41,6 +159,162 @@ class Board:
         for i in range(8):
             self.board[6][i] = Pawn("white")
 
+        self.recompute_state()
+
+    def recompute_state(self):
+        """
+        Rebuild the bitboards, king squares, piece lists, material and hash from self.board.
+        Call this after editing self.board directly instead of through move_piece.
+        This also restarts repetition counting from the current position.
+        """
+        self.white_bb, self.black_bb = bitboard.occupancy(self.board)
+        self.king_squares = {"white": None, "black": None}
+        self.pieces = {"white": {}, "black": {}}
+        self.material = {"white": 0, "black": 0}
+        self.codes = bytearray(64)
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece is not None:
+                    self.codes[row * 8 + col] = PIECE_CODES[piece.symbol]
+                    self.pieces[piece.color][(row, col)] = piece
+                    self.material[piece.color] += piece.point
+                    if isinstance(piece, King):
+                        self.king_squares[piece.color] = (row, col)
+        self.hash = zobrist.hash_board(self)
+        self.position_counts = {self.hash: 1}
+        if self._planes is not None:
+            self._fill_planes(self._planes)
+
+    def planes(self):
+        """
+        One-hot piece planes of the position, the layout of encoder.encode_boards.
+
+        The buffer is allocated (importing NumPy) on the first call and from then on kept
+        up to date by every move and undo, so repeated calls cost nothing.
+
+        :return: A read-only (12, 8, 8) float32 NumPy view of the board's own buffer. It
+                 changes with the board; copy it to keep the current position.
+        """
+        if self._planes is None:
+            import numpy as np
+            planes = np.zeros((12, 64), dtype=np.float32)
+            self._fill_planes(planes)
+            self._set_planes(planes)
+        return self._planes_view
+
+    def _fill_planes(self, planes):
+        planes[:] = 0
+        for square, code in enumerate(self.codes):
+            if code:
+                planes[code - 1, square] = 1
+
+    def _set_planes(self, planes):
+        self._planes = planes
+        self._planes_view = planes.view().reshape(12, 8, 8)
+        self._planes_view.flags.writeable = False
+
+    def _place(self, row, col, piece):
+        """Put a piece (or None) on a square, keeping the incremental state in sync."""
+        index = row * 8 + col
+        square = bitboard.SQUARES[index]
+        bit = 1 << index
+        old = self.board[row][col]
+        code = PIECE_CODES[piece.symbol] if piece is not None else 0
+        if self._planes is not None:
+            if old is not None:
+                self._planes[self.codes[index] - 1, index] = 0
+            if piece is not None:
+                self._planes[code - 1, index] = 1
+        self.codes[index] = code
+        if old is not None:
+            color = old.color
+            if color == "white":
+                self.white_bb &= ~bit
+            else:
+                self.black_bb &= ~bit
+            del self.pieces[color][square]
+            self.material[color] -= old.point
+            self.hash ^= zobrist.PIECE_KEYS[old.symbol][index]
+            if self.king_squares[color] == square and isinstance(old, King):
+                self.king_squares[color] = None
+        if piece is not None:
+            color = piece.color
+            if color == "white":
+                self.white_bb |= bit
+            else:
+                self.black_bb |= bit
+            self.pieces[color][square] = piece
+            self.material[color] += piece.point
+            self.hash ^= zobrist.PIECE_KEYS[piece.symbol][index]
+            if isinstance(piece, King):
+                self.king_squares[color] = square
+        self.board[row][col] = piece
+
+    def apply_move(self, start, end):
+        """
+        Make a move without validating it; the unchecked half of move_piece.
+        Search code pairs this with undo_move to walk the move tree in place.
+
+        :param start: (row, col) of the piece to move.
+        :param end: (row, col) to move it to.
+        :return: The piece that stood on `end` before the move, or None.
+        """
+        start_row, start_col = start
+        end_row, end_col = end
+        moving_piece = self.board[start_row][start_col]
+        captured_piece = self.board[end_row][end_col]
+        state = (self.white_turn, self.white_castle_king_side, self.black_castle_king_side)
+        self.move_history.append((start, end, captured_piece, state, self.hash))
+
+        self._place(end_row, end_col, moving_piece)
+        self._place(start_row, start_col, None)
+
+        # Moving the king or king-side rook, or losing that rook, gives up castling
+        if start == (7, 4) or start == (7, 7) or end == (7, 7):
+            self.white_castle_king_side = False
+        if start == (0, 4) or start == (0, 7) or end == (0, 7):
+            self.black_castle_king_side = False
+        self.white_turn = moving_piece.color == "black"
+        self.hash ^= zobrist.state_key(*state) ^ zobrist.state_key(
+            self.white_turn, self.white_castle_king_side, self.black_castle_king_side)
+        self.position_counts[self.hash] = self.position_counts.get(self.hash, 0) + 1
+        return captured_piece
+
+    def hash_after(self, start, end):
+        """
+        Zobrist hash of the position after a move, without making it.
+
+        :param start: (row, col) of the piece to move.
+        :param end: (row, col) to move it to.
+        :return: A 64-bit integer, equal to self.hash after apply_move(start, end).
+        """
+        moving_piece = self.board[start[0]][start[1]]
+        start_square = start[0] * 8 + start[1]
+        end_square = end[0] * 8 + end[1]
+        key = self.hash ^ zobrist.PIECE_KEYS[moving_piece.symbol][start_square]
+        if start_square != end_square:
+            captured_piece = self.board[end[0]][end[1]]
+            if captured_piece is not None:
+                key ^= zobrist.PIECE_KEYS[captured_piece.symbol][end_square]
+            key ^= zobrist.PIECE_KEYS[moving_piece.symbol][end_square]
+
+        white_castle = self.white_castle_king_side and not (
+            start == (7, 4) or start == (7, 7) or end == (7, 7))
+        black_castle = self.black_castle_king_side and not (
+            start == (0, 4) or start == (0, 7) or end == (0, 7))
+        return key ^ zobrist.state_key(
+            self.white_turn, self.white_castle_king_side, self.black_castle_king_side) ^ zobrist.state_key(
+            moving_piece.color == "black", white_castle, black_castle)
+
+    def repetition_count(self, key=None):
+        """
+        Number of times a position has occurred in this game.
+
+        :param key: Zobrist hash to look up, defaults to the current position.
+        """
+        return self.position_counts.get(self.hash if key is None else key, 0)
+
     def undo_move(self):
             """
             Revert the last move made on the board.
@@ -50,17 +324,31 @@ class Board:
                 return
 
             # Get the last move from the history
-            start_pos, end_pos, captured_piece = self.move_history.pop()
+            start_pos, end_pos, captured_piece, state, position_hash = self.move_history.pop()
+            self.white_turn, self.white_castle_king_side, self.black_castle_king_side = state
+            count = self.position_counts[self.hash] - 1
+            if count:
+                self.position_counts[self.hash] = count
+            else:
+                del self.position_counts[self.hash]
 
             # Move the piece back to its original position
             start_row, start_col = start_pos
             end_row, end_col = end_pos
             moving_piece = self.get_piece(end_row, end_col)
 
-            self.board[start_row][start_col] = moving_piece
-            self.board[end_row][end_col] = captured_piece  # Restore captured piece, if any
+            self._place(start_row, start_col, moving_piece)
+            self._place(end_row, end_col, captured_piece)  # Restore captured piece, if any
+            self.hash = position_hash
 
     def get_all_legal_moves(self, color):
+        if self.backend == "scan":
+            return self._scan_legal_moves(color)
+        if color == "white":
+            return bitboard.generate_moves(self.board, self.white_bb, self.black_bb, True)
+        return bitboard.generate_moves(self.board, self.black_bb, self.white_bb, False)
+
+    def _scan_legal_moves(self, color):
         legal_moves = []
         for row in range(8):
             for col in range(8):
@@ -105,10 +393,8 @@ class Board:
         if turn == moving_piece.color:
           if move_to_piece:
             point = move_to_piece.point
-          self.move_history.append((start, end, move_to_piece))
           # Perform the move
-          self.board[end_row][end_col] = moving_piece
-          self.board[start_row][start_col] = None
+          self.apply_move(start, end)
           return True, point
 
         return False, point
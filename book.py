@@ -0,0 +1,239 @@
+# book.py
+"""
+Opening book: move statistics for positions near the start of the game.
+
+The book is a binary file that is memory-mapped for lookups:
+
+    8 bytes   magic b"MLCBOOK1"
+    8 bytes   number of entries N (little-endian uint64)
+    N x 8     position hashes (Board.hash), sorted
+    N x 18    BOOK_DTYPE entries in the same order
+
+There is one entry per (position, move) pair. A position's entries are found
+by a binary search over the contiguous hash column, so a lookup only touches a
+few pages of the file. Books are built from self-play shards (see shards.py) or
+from PGN files (see pgn.py). Results are counted from the point of view of the
+side that played the move.
+
+Usage:
+    python book.py build --shards self_play_data --pgn games.pgn --out book.bin --plies 16
+    python book.py probe book.bin
+    python book.py probe book.bin --fen "<fen>"
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from encoder import index_to_move, move_to_index
+from shards import open_shard, shard_files
+
+MAGIC = b"MLCBOOK1"
+_HEADER_SIZE = 16
+
+BOOK_DTYPE = np.dtype([
+    ('move', '<i2'),    # Move index, see encoder.move_to_index
+    ('count', '<u4'),   # Times the move was played
+    ('wins', '<u4'),    # Games the mover went on to win
+    ('draws', '<u4'),
+    ('losses', '<u4'),
+])
+
+# Per-move samples collected while building: position hash, move and result for the mover
+_SAMPLE_DTYPE = np.dtype([('hash', '<u8'), ('move', '<i2'), ('score', 'i1')])
+
+_open_books = {}  # path -> OpeningBook, see load_book
+
+
+def _samples(records, plies):
+    """Book samples of the RECORD_DTYPE records played within the first `plies` plies."""
+    records = records[records['ply'] < plies]
+    samples = np.empty(len(records), dtype=_SAMPLE_DTYPE)
+    samples['hash'] = records['hash']
+    samples['move'] = records['move']
+    # 'result' is from white's point of view
+    samples['score'] = np.where(records['white_turn'] != 0, records['result'], -records['result'])
+    return samples
+
+
+def shard_samples(shard_dir, plies):
+    """Book samples from every shard in a directory."""
+    return [_samples(np.asarray(open_shard(path)), plies) for path in shard_files(shard_dir)]
+
+
+def pgn_samples(path, plies):
+    """Book samples from the games of a PGN file (only their first `plies` moves are replayed)."""
+    from pgn import game_records, read_games
+
+    samples = []
+    for headers, moves in read_games(path):
+        samples.append(_samples(game_records(headers, moves[:plies]), plies))
+    return samples
+
+
+def write_book(samples, path, min_count=1):
+    """
+    Aggregate samples into a book file.
+
+    :param samples: List of _SAMPLE_DTYPE arrays (see shard_samples and pgn_samples).
+    :param path: Output file; it is replaced atomically.
+    :param min_count: Drop moves played fewer times than this.
+    :return: The number of entries written.
+    """
+    samples = np.concatenate(samples) if samples else np.zeros(0, dtype=_SAMPLE_DTYPE)
+    samples = samples[np.lexsort((samples['move'], samples['hash']))]
+
+    # Group identical (hash, move) pairs
+    boundary = np.ones(len(samples), dtype=bool)
+    boundary[1:] = (samples['hash'][1:] != samples['hash'][:-1]) | (samples['move'][1:] != samples['move'][:-1])
+    starts = np.flatnonzero(boundary)
+    counts = np.diff(np.append(starts, len(samples)))
+    keep = counts >= min_count
+    entries = np.zeros(int(keep.sum()), dtype=BOOK_DTYPE)
+    hashes = samples['hash'][starts][keep]
+    if len(entries):
+        score = samples['score']
+        wins = np.add.reduceat((score > 0).astype(np.uint32), starts)[keep]
+        draws = np.add.reduceat((score == 0).astype(np.uint32), starts)[keep]
+        entries['move'] = samples['move'][starts][keep]
+        entries['count'] = counts[keep]
+        entries['wins'] = wins
+        entries['draws'] = draws
+        entries['losses'] = counts[keep] - wins - draws
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(entries)).tobytes())
+        f.write(np.ascontiguousarray(hashes, dtype='<u8').tobytes())
+        f.write(entries.tobytes())
+    os.replace(temporary, path)
+    return len(entries)
+
+
+def build_book(path, shard_dirs=(), pgn_paths=(), plies=16, min_count=1):
+    """
+    Build a book from self-play shards and PGN files.
+
+    :param path: Output book file.
+    :param shard_dirs: Shard directories (see shards.py).
+    :param pgn_paths: PGN files.
+    :param plies: Only moves played within the first `plies` plies of a game are counted.
+    :param min_count: Drop moves played fewer times than this.
+    :return: The number of entries written.
+    """
+    samples = []
+    for shard_dir in shard_dirs:
+        samples += shard_samples(shard_dir, plies)
+    for pgn_path in pgn_paths:
+        samples += pgn_samples(pgn_path, plies)
+    return write_book(samples, path, min_count)
+
+
+class OpeningBook:
+    """Read-only, memory-mapped book file."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(_HEADER_SIZE)
+        if len(header) < _HEADER_SIZE or header[:8] != MAGIC:
+            raise ValueError(f"{path} is not an opening book")
+        count = int(np.frombuffer(header[8:], dtype='<u8')[0])
+        self.path = path
+        if count:
+            self.hashes = np.memmap(path, dtype='<u8', mode='r', offset=_HEADER_SIZE, shape=(count,))
+            self.entries = np.memmap(path, dtype=BOOK_DTYPE, mode='r', offset=_HEADER_SIZE + 8 * count,
+                                     shape=(count,))
+        else:
+            self.hashes = np.zeros(0, dtype='<u8')
+            self.entries = np.zeros(0, dtype=BOOK_DTYPE)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def lookup(self, key):
+        """
+        Book entries of a position.
+
+        :param key: Board.hash of the position.
+        :return: A BOOK_DTYPE array, empty if the position is not in the book.
+        """
+        key = np.uint64(key)
+        start = np.searchsorted(self.hashes, key, side='left')
+        end = np.searchsorted(self.hashes, key, side='right')
+        return self.entries[start:end]
+
+    def moves(self, board):
+        """
+        Book moves of a position that are legal in it.
+
+        :return: A list of (move, count, wins, draws, losses), most played first.
+        """
+        entries = self.lookup(board.hash)
+        if not len(entries):
+            return []
+        legal = set(board.get_all_legal_moves("white" if board.white_turn else "black"))
+        result = []
+        for entry in entries:
+            move = index_to_move(entry['move'])
+            if move in legal:  # Guards against hash collisions
+                result.append((move, int(entry['count']), int(entry['wins']), int(entry['draws']),
+                               int(entry['losses'])))
+        result.sort(key=lambda item: -item[1])
+        return result
+
+    def choose(self, board, rng=None, min_count=1):
+        """
+        Pick a book move for the side to move.
+
+        :param rng: random.Random used to pick a move with probability proportional to how often
+                    it was played, for varied openings; None plays the best scoring move.
+        :param min_count: Ignore moves played fewer times than this.
+        :return: A move ((row, col), (row, col)), or None when the position is out of book.
+        """
+        moves = [item for item in self.moves(board) if item[1] >= min_count]
+        if not moves:
+            return None
+        if rng is not None:
+            return rng.choices([item[0] for item in moves], weights=[item[1] for item in moves])[0]
+        # Best score for the mover, ties to the most played move
+        return max(moves, key=lambda item: ((item[2] + 0.5 * item[3]) / item[1], item[1]))[0]
+
+
+def load_book(path):
+    """The OpeningBook at `path`, opened once per process."""
+    book = _open_books.get(path)
+    if book is None:
+        book = _open_books[path] = OpeningBook(path)
+    return book
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect an opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build a book from shards and PGN files.")
+    build.add_argument("--out", default="book.bin", help="Book file (default: book.bin).")
+    build.add_argument("--shards", nargs="*", default=[], help="Self-play shard directories.")
+    build.add_argument("--pgn", nargs="*", default=[], help="PGN files.")
+    build.add_argument("--plies", type=int, default=16, help="Plies counted per game (default: 16).")
+    build.add_argument("--min-count", type=int, default=1, help="Drop rarer moves (default: 1).")
+    probe = commands.add_parser("probe", help="Print the book moves of a position.")
+    probe.add_argument("book")
+    probe.add_argument("--fen", help="Position (default: the start position).")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        entries = build_book(args.out, args.shards, args.pgn, args.plies, args.min_count)
+        print(f"Wrote {entries} book entries to {args.out}.")
+        return 0
+
+    from board import Board
+    board = Board.from_fen(args.fen) if args.fen else Board()
+    book = OpeningBook(args.book)
+    for move, count, wins, draws, losses in book.moves(board):
+        print(f"{move} [{move_to_index(move)}]: {count} games, +{wins} ={draws} -{losses}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
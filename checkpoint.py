@@ -0,0 +1,173 @@
+# checkpoint.py
+"""
+Atomic, asynchronous checkpoints for long self-play and training runs.
+
+A checkpoint is one torch.save file holding whatever state dict the run
+passes in (model and optimizer state, self-play progress with its shard
+cursor, the trainer position, RNG states). save() snapshots the state in the
+calling thread, which only copies tensors, and a background thread writes
+it to a temporary file that then atomically replaces the previous
+checkpoint, so a crash at any point leaves a complete checkpoint behind.
+If saves come faster than the disk can take them, only the newest pending
+one is written.
+
+Usage:
+    checkpointer = Checkpointer("checkpoint.pt", interval=300)
+    ...
+    if checkpointer.due():
+        checkpointer.save({"model": model.state_dict(), "rng": rng_state(), ...})
+    ...
+    checkpointer.close()  # waits for the last write
+    state = load_checkpoint("checkpoint.pt")  # None if there is none
+"""
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import torch
+
+
+def snapshot(state):
+    """
+    Copy of a nested dict/list/tuple structure whose tensors and arrays are detached
+    CPU copies, so the original can keep changing while the copy is written.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, np.ndarray):
+        return state.copy()
+    if isinstance(state, dict):
+        return {key: snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(value) for value in state)
+    return state
+
+
+def rng_state():
+    """The Python, NumPy and torch global RNG states."""
+    return {"python": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+
+
+def set_rng_state(state):
+    """Restore the RNG states returned by rng_state."""
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+
+
+def write_atomic(state, path):
+    """torch.save `state` to `path` so that readers only ever see a complete file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    # Make the rename itself durable
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def load_checkpoint(path):
+    """
+    Load a checkpoint written by Checkpointer.
+
+    :return: The saved state dict, or None if there is no checkpoint at `path`.
+    """
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, map_location="cpu", weights_only=False)
+
+
+class Checkpointer:
+    """Writes checkpoints to one path on a background thread."""
+    def __init__(self, path, interval=300.0):
+        """
+        :param path: Checkpoint file; it is replaced atomically by every save.
+        :param interval: Seconds between checkpoints, see due().
+        """
+        self.path = path
+        self.interval = interval
+        self.saves = 0
+        self.last_save = time.monotonic()
+        self.write_seconds = 0.0
+        self._pending = None
+        self._error = None
+        self._condition = threading.Condition()
+        self._writing = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def due(self):
+        """Whether `interval` seconds have passed since the last save."""
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, state, wait=False):
+        """
+        Snapshot `state` and queue it for writing, replacing a queued but unwritten save.
+
+        :param state: Dict of tensors, arrays, containers and picklable values.
+        :param wait: Block until this checkpoint is on disk.
+        """
+        self._raise_error()
+        state = snapshot(state)
+        with self._condition:
+            self._pending = state
+            self._condition.notify_all()
+        self.last_save = time.monotonic()
+        if wait:
+            self.wait()
+
+    def wait(self):
+        """Block until every queued checkpoint is on disk."""
+        with self._condition:
+            while self._pending is not None or self._writing:
+                self._condition.wait()
+        self._raise_error()
+
+    def close(self):
+        """Write the last queued checkpoint and stop the writer thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"Writing checkpoint {self.path} failed") from error
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                state, self._pending = self._pending, None
+                self._writing = True
+            start = time.perf_counter()
+            try:
+                write_atomic(state, self.path)
+                self.saves += 1
+            except Exception as error:  # Reported to the training thread by the next call
+                self._error = error
+            self.write_seconds += time.perf_counter() - start
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
@@ -1,7 +1,29 @@
 # for training
 TRAIN_GAMES = 100000
 EPOCH = 10
+BATCH_SIZE = 64
+LOADER_WORKERS = 2  # DataLoader processes preparing batches during training
+AUGMENT = True  # Color flip + vertical mirror augmentation
 VISUAL_TIME = 1
+SELF_PLAY_WORKERS = None  # None uses every CPU core
+MAX_GAME_PLIES = 512  # Headless self-play games are cut off after this many plies
+SELF_PLAY_DIR = "self_play_data"  # Shard directory for self-play positions
+CHECKPOINT_PATH = "checkpoint.pt"  # Run state saved by train.py, continued with --resume
+CHECKPOINT_INTERVAL = 300  # Seconds between checkpoints
+PIPELINE = False  # train.py trains while self-play runs (see replay.py) instead of after it, also --pipeline
+PIPELINE_STEPS = 100000  # Optimizer steps of a pipelined run
+INSTRUMENT = False  # Time the hot paths of train.py and print a summary (see instrument.py)
+INSTRUMENT_TRACE = None  # With INSTRUMENT, also write a Chrome trace to this path
+INSTRUMENT_PROFILE = None  # With INSTRUMENT, also write cProfile stats to this path
+MCTS_NODES = 0  # MCTS simulations per self-play move, 0 plays the policy's choice without search
+GAME_ENGINE = "mcts"  # Opponent in game.py: "mcts", "alphabeta" (material only, no network) or "policy"
+ENGINE_TIME_LIMIT = 1.0  # Seconds the game.py engine searches per move
+MODEL_BACKEND = "eager"  # Inference backend of loaded models, see model.BACKENDS
+MODEL_LOGITS = False  # Loaded models return logits instead of softmax probabilities
+EVAL_CACHE_SIZE = 8192  # Model outputs cached by position in self-play, game.py and arena.py (8 KB each), 0 for none
+EVAL_CACHE_TOP_K = None  # Cache only each output's top k moves instead of all 4096
+OPENING_BOOK = None  # Opening book file (see book.py) used by self-play, game.py and arena.py, None for none
+BOOK_PLIES = 16  # Book moves are only played within the first BOOK_PLIES plies of a game
 
 # For visual
 WHITE = (255, 255, 255)
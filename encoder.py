@@ -1,32 +1,134 @@
-import torch
 import random
+import numpy as np
 
-from torch.nn.modules.container import ParameterDict
+from bitboard import PIECE_INDEX
+
+# torch is imported inside the functions that build tensors, so tools that only
+# need board_to_codes or the move index helpers do not pay for loading it.
+
+# Piece codes used by the compact int8 board representation: 0 is an empty
+# square and code c > 0 is the piece encoded on channel c - 1.
+# Channels: PW, NW, BW, RW, QW, KW, PB, NB, BB, RB, QB, KB (P=pawn, N=knight, B=bishop, R=rook, Q=queen, K=king, W=white, B=black)
+PIECE_CODES = {symbol: index + 1 for symbol, index in PIECE_INDEX.items()}
+
+def board_to_codes(board):
+    """
+    Convert a Board into its compact piece-code array.
+
+    :param board: A Board instance.
+    :return: An int8 NumPy array of shape (8, 8) holding PIECE_CODES (0 for empty squares).
+    """
+    # Board keeps the codes up to date itself; copy them so the array is a snapshot
+    return np.frombuffer(bytes(board.codes), dtype=np.int8).reshape(8, 8)
+
+def encode_boards(boards, out=None):
+    """
+    Encode a batch of positions into one tensor of one-hot piece planes.
+
+    :param boards: A list of Board instances or of (8, 8) piece-code arrays (see board_to_codes),
+                   or an int8 array of piece codes with shape (N, 8, 8).
+    :param out: Optional preallocated float tensor of shape (N, 12, 8, 8) to write into;
+                reusing it avoids allocating a new tensor on every call.
+    :return: A float32 tensor of shape (N, 12, 8, 8) (`out` itself if given).
+    """
+    import torch
+    if isinstance(boards, np.ndarray):
+        codes = boards.reshape(-1, 64)
+    else:
+        codes = np.stack([board_to_codes(board) if hasattr(board, "pieces") else np.asarray(board, dtype=np.int8)
+                          for board in boards]).reshape(-1, 64)
+    n = codes.shape[0]
+
+    if out is None:
+        out = torch.zeros((n, 12, 8, 8), dtype=torch.float32)
+    else:
+        assert out.shape == (n, 12, 8, 8)
+        out.zero_()
+
+    # Scatter a 1 into (board, channel, square) for every occupied square in a single indexing op
+    batch, square = np.nonzero(codes)
+    channel = codes[batch, square].astype(np.int64) - 1
+    out.view(n, 12, 64)[torch.from_numpy(batch), torch.from_numpy(channel), torch.from_numpy(square)] = 1
+    return out
+
+def move_to_index(move):
+    """
+    Map a move ((start_row, start_col), (end_row, end_col)) to its from-square x to-square
+    index in [0, 4096), the layout of ChessModel's output.
+    """
+    (start_row, start_col), (end_row, end_col) = move
+    return (start_row * 8 + start_col) * 64 + end_row * 8 + end_col
+
+def index_to_move(index):
+    """Inverse of move_to_index."""
+    start, end = divmod(int(index), 64)
+    return (start // 8, start % 8), (end // 8, end % 8)
+
+def legal_move_mask(legal_moves):
+    """
+    Turn a legal-move list into a mask over the model's 4096 outputs.
+
+    :param legal_moves: A list of moves ((start_row, start_col), (end_row, end_col)).
+    :return: A bool tensor of shape (4096,), True at the index of every legal move.
+    """
+    import torch
+    mask = torch.zeros(4096, dtype=torch.bool)
+    mask[[move_to_index(move) for move in legal_moves]] = True
+    return mask
+
+def legal_move_masks(legal_move_lists):
+    """
+    Batched legal_move_mask.
+
+    :param legal_move_lists: One legal-move list per position.
+    :return: A bool tensor of shape (N, 4096).
+    """
+    import torch
+    rows, indices = [], []
+    for row, legal_moves in enumerate(legal_move_lists):
+        rows.extend([row] * len(legal_moves))
+        indices.extend(move_to_index(move) for move in legal_moves)
+    masks = torch.zeros((len(legal_move_lists), 4096), dtype=torch.bool)
+    masks[rows, indices] = True
+    return masks
+
+def masked_argmax(outputs, masks):
+    """
+    Highest-scoring legal move of every position in a batch.
+
+    :param outputs: Model outputs of shape (N, 4096), probabilities or logits.
+    :param masks: Bool legal-move masks of shape (N, 4096).
+    :return: A long tensor of N move indices.
+    """
+    return outputs.masked_fill(~masks, float("-inf")).argmax(dim=1)
+
+def masked_sample(outputs, masks, temperature=1.0, logits=False, generator=None):
+    """
+    Sample one legal move per position in a batch.
+
+    :param outputs: Model outputs of shape (N, 4096).
+    :param masks: Bool legal-move masks of shape (N, 4096).
+    :param temperature: Sharpens (< 1) or flattens (> 1) the distribution.
+    :param logits: True if `outputs` are logits rather than softmax probabilities.
+    :param generator: Optional torch.Generator for reproducible sampling.
+    :return: A long tensor of N move indices.
+    """
+    import torch
+    scores = outputs if logits else torch.log(outputs.clamp_min(1e-12))
+    scores = scores.masked_fill(~masks, float("-inf")) / temperature
+    probs = torch.softmax(scores, dim=1)
+    return torch.multinomial(probs, 1, generator=generator).squeeze(1)
 
 def encode_board_state(board):
     """
     Encode the board state into a tensor suitable for neural network input.
 
-    :param board: A 2D array representing the board state, with each cell containing a piece object or None.
+    :param board: A Board instance.
     :return: A PyTorch tensor of shape (1, 12, 8, 8) representing the encoded board state.
     """
-    # Initialize an empty tensor with zeros. Shape: (15, 8, 8).
-    # 15 channels for the pieces: PW, NW, BW, RW, QW, KW, PB, NB, BB, RB, QB, KB (P=pawn, N=knight, B=bishop, R=rook, Q=queen, K=king, W=white, B=black)
-    encoded_board = torch.zeros((12, 8, 8), dtype=torch.float32)
-
-    piece_to_channel = {
-        'PW': 0, 'NW': 1, 'BW': 2, 'RW': 3, 'QW': 4, 'KW': 5,
-        'PB': 6, 'NB': 7, 'BB': 8, 'RB': 9, 'QB': 10, 'KB': 11
-    }
-
-    for row in range(8):
-        for col in range(8):
-            piece = board.get_piece(row, col)
-            if piece is not None:
-                symbol = piece.symbol.upper() if piece.color == 'white' else piece.symbol.lower()
-                color = 'W' if piece.color == 'white' else 'B'
-                channel = piece_to_channel[f'{symbol.upper()}{color}']
-                encoded_board[channel, row, col] = 1
+    import torch
+    # Copy the board's incrementally maintained planes instead of re-encoding them
+    encoded_board = torch.from_numpy(board.planes().copy()).unsqueeze(0)
 
     # Channel 12: Whose turn it is (1 for white's turn, 0 for black's turn)
     # encoded_board[12, :, :] = 1 if board.is_white_turn() else 0
@@ -35,29 +137,39 @@ def encode_board_state(board):
     # # Channel 14: Can black castle king-side
     # encoded_board[14, :, :] = 1 if board.can_castle_king_side('black') else 0
 
-    assert encoded_board.shape[0] == 12
-    # Add an extra dimension at the beginning to indicate batch size of 1
-    encoded_board = encoded_board.unsqueeze(0)
+    assert encoded_board.shape[1] == 12
     return encoded_board
 
 def decode_move(move_index, board, legal_moves):
+  """
+  Turn a move index from the model's output (see move_to_index) into a move.
+  """
   if legal_moves:
-    # Ensure move_index is within bounds, otherwise pick a random legal move
-    if move_index >= len(legal_moves):
-      print("Predicted move index is out of bounds, selecting a random legal move.")
+    # Ensure the move is legal, otherwise pick a random legal move
+    move = index_to_move(move_index)
+    if move not in legal_moves:
+      print("Predicted move is not legal, selecting a random legal move.")
       return random.choice(legal_moves)
-    return legal_moves[move_index]
+    return move
   else:
     print("No legal moves available.")
     return None
 
-def predict_move(model, board, color):
+def predict_move(model, board, color, legal_moves=None):
+    """
+    Pick the model's highest-probability legal move.
+
+    :param legal_moves: The legal moves of `color`, if the caller already has them.
+    """
+    import torch
     board_tensor = encode_board_state(board)
-    legal_moves = board.get_all_legal_moves(color)
-    print(board, board_tensor.shape)
+    if legal_moves is None:
+        legal_moves = board.get_all_legal_moves(color)
+    if not legal_moves:
+        return decode_move(0, board, legal_moves)
     with torch.no_grad():
         output = model(board_tensor)
-        predicted_move_index = output.argmax(1).item()
+        predicted_move_index = masked_argmax(output, legal_move_mask(legal_moves).unsqueeze(0)).item()
     return decode_move(predicted_move_index, board, legal_moves)
 
 def select_legal_move(model_output, legal_moves):
@@ -68,9 +180,8 @@ def select_legal_move(model_output, legal_moves):
     :param legal_moves: A list of legal moves in the current game state.
     :return: The index of a legal move selected based on model output probabilities.
     """
-    # Assume legal_moves are encoded in some format that matches model output indices
-    # Filter model outputs to only include legal moves
-    legal_probs = model_output[0, legal_moves]
+    # Filter model outputs to only include legal moves, via their from x to square index
+    legal_probs = model_output[0, [move_to_index(move) for move in legal_moves]]
     legal_move_index = legal_probs.argmax().item()  # Index of the highest probability legal move
 
     assert len(legal_probs) == len(legal_moves)
@@ -0,0 +1,285 @@
+# eval_cache.py
+"""
+Bounded cache of model outputs, shared by threads and, optionally, processes.
+
+Openings, repetitions and transpositions make the same positions come up
+again and again in self-play, MCTS and arena games. The evaluators in
+inference.py take an EvalCache and only run the model on misses.
+
+Entries are keyed by the position's piece placement (the model's only input,
+see position_key) and tagged with a version of the model weights (see
+model_version). The cache holds the current version, and entries with any
+other version count as misses, so updating the weights invalidates the whole
+cache without touching it.
+
+Storage is a set-associative table in flat NumPy arrays, like a
+transposition table: a key can live in one of `ways` slots of its set, and a
+full set evicts its least recently used slot. Outputs are stored as float16,
+or as their top_k largest values plus one fill value for the rest. With
+shared=True the arrays live in shared memory, so worker processes forked
+after the cache was created (or given it as a Pool argument) read and write
+the same entries.
+"""
+import hashlib
+import itertools
+import multiprocessing
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+
+import zobrist
+from bitboard import PIECE_INDEX
+
+OUTPUT_SIZE = 4096
+
+# _PIECE_KEYS[code, square] is the Zobrist key of the piece with that code (see
+# encoder.PIECE_CODES) on that square; code 0 (empty) has key 0
+_PIECE_KEYS = np.zeros((13, 64), dtype=np.uint64)
+for _symbol, _index in PIECE_INDEX.items():
+    _PIECE_KEYS[_index + 1] = zobrist.PIECE_KEYS[_symbol]
+_SQUARES = np.arange(64)
+
+# Slots of the counters array
+_HITS, _MISSES, _EVICTIONS, _STALE, _CLOCK, _VERSION = range(6)
+
+# model -> (parameter version counters, version); weak, so a new model that reuses a collected
+# model's id does not inherit its version
+_model_versions = weakref.WeakKeyDictionary()
+_module_serials = itertools.count(1)  # Identity of modules without parameters
+
+
+def position_key(codes):
+    """
+    64-bit key of a position's piece placement: the piece part of its Zobrist hash.
+
+    :param codes: (8, 8) int8 piece codes, see encoder.board_to_codes.
+    """
+    return int(np.bitwise_xor.reduce(_PIECE_KEYS[np.asarray(codes).reshape(64), _SQUARES]))
+
+
+def model_version(model, refresh=False):
+    """
+    Version of a model's weights and output kind, equal across processes for equal weights.
+
+    The weights are hashed again only after PyTorch's in-place version counter of a
+    parameter changed (optimizer steps, load_state_dict, in-place ops on the parameters),
+    so calls are cheap. Writes through `parameter.data` (e.g. EMA updates) do not bump the
+    counter: pass refresh=True after them. Modules without parameters (frozen TorchScript)
+    are versioned by identity instead.
+
+    :param refresh: Hash the weights even if no version counter changed.
+    :return: A nonzero 64-bit integer.
+    """
+    parameters = list(model.parameters())
+    counters = tuple(parameter._version for parameter in parameters)
+    cached = _model_versions.get(model)
+    if cached is not None and cached[0] == counters and not (refresh and parameters):
+        return cached[1]
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{getattr(model, 'backend', 'eager')}:{getattr(model, 'logits', False)}".encode())
+    if parameters:
+        for parameter in parameters:
+            digest.update(parameter.detach().cpu().contiguous().numpy().view(np.uint8))
+    else:
+        digest.update(f"module {next(_module_serials)}".encode())
+    version = int.from_bytes(digest.digest(), "little") | 1
+    _model_versions[model] = (counters, version)
+    return version
+
+
+class EvalCache:
+    """Set-associative LRU cache of (4096,) model outputs; see the module docstring."""
+    def __init__(self, capacity=8192, ways=4, top_k=None, shared=False):
+        """
+        :param capacity: Number of entries, rounded up to a power-of-two number of sets.
+        :param ways: Slots per set; a key can only be stored in the slots of its set.
+        :param top_k: Keep only the top_k largest outputs (and the mean of the others, returned
+                      for every other move) instead of all 4096 as float16.
+        :param shared: Keep the table in shared memory for use by worker processes.
+        """
+        sets = 1
+        while sets * ways < capacity:
+            sets *= 2
+        self.sets = sets
+        self.ways = ways
+        self.top_k = top_k
+        self.shared = shared
+        self._layout = self._make_layout(sets * ways, top_k)
+        size = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in self._layout)
+        if shared:
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+            self._lock = multiprocessing.Lock()
+            buffer = self._memory.buf
+        else:
+            self._memory = None
+            self._owner = False
+            self._lock = threading.Lock()
+            buffer = bytearray(size)
+        self._attach(buffer)
+
+    @staticmethod
+    def _make_layout(slots, top_k):
+        layout = [("counters", np.uint64, (6,)),
+                  ("keys", np.uint64, (slots,)),
+                  ("versions", np.uint64, (slots,)),  # 0 marks an empty slot
+                  ("stamps", np.int64, (slots,))]     # Clock value of the last use
+        if top_k is None:
+            layout.append(("outputs", np.float16, (slots, OUTPUT_SIZE)))
+        else:
+            layout += [("indices", np.int16, (slots, top_k)),
+                       ("values", np.float16, (slots, top_k)),
+                       ("fill", np.float16, (slots,))]
+        return layout
+
+    def _attach(self, buffer):
+        offset = 0
+        for name, dtype, shape in self._layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            setattr(self, f"_{name}", array)
+            offset += array.nbytes
+
+    def __getstate__(self):
+        if not self.shared:
+            raise TypeError("Only a shared EvalCache can be passed to another process")
+        state = self.__dict__.copy()
+        state["_memory"] = self._memory.name
+        for name, _, _ in self._layout:
+            del state[f"_{name}"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._memory = shared_memory.SharedMemory(name=state["_memory"])
+        self._owner = False
+        self._attach(self._memory.buf)
+
+    def __len__(self):
+        return int(np.count_nonzero(self._versions == self._counters[_VERSION]))
+
+    @property
+    def version(self):
+        return int(self._counters[_VERSION])
+
+    def set_version(self, version):
+        """Make `version` current; entries stored under any other version become misses."""
+        self._counters[_VERSION] = version
+
+    def sync(self, model, refresh=False):
+        """
+        set_version(model_version(model, refresh)); returns the version.
+
+        Call it with refresh=True after changing the weights through `parameter.data`.
+        """
+        version = model_version(model, refresh)
+        if version != self.version:
+            self.set_version(version)
+        return version
+
+    def _slots(self, key):
+        start = (key & (self.sets - 1)) * self.ways
+        return start, start + self.ways
+
+    def get(self, key):
+        """
+        Look up a position.
+
+        :param key: position_key of the position.
+        :return: The cached (4096,) float32 output tensor, or None.
+        """
+        start, end = self._slots(key)
+        key = np.uint64(key)
+        with self._lock:
+            counters = self._counters
+            for slot in range(start, end):
+                if self._keys[slot] == key and self._versions[slot]:
+                    if self._versions[slot] != counters[_VERSION]:
+                        counters[_STALE] += 1
+                        break
+                    counters[_HITS] += 1
+                    counters[_CLOCK] += 1
+                    self._stamps[slot] = counters[_CLOCK]
+                    return self._read(slot)
+            counters[_MISSES] += 1
+        return None
+
+    def put(self, key, output, version=None):
+        """
+        Store the output of a position.
+
+        :param key: position_key of the position.
+        :param output: (4096,) output tensor or array.
+        :param version: Model version the output was computed with, default the current one;
+                        outputs of an older version are dropped.
+        """
+        if version is not None and version != self.version:
+            return
+        start, end = self._slots(key)
+        key = np.uint64(key)
+        output = output.detach().cpu().numpy() if isinstance(output, torch.Tensor) else np.asarray(output)
+        with self._lock:
+            counters = self._counters
+            current = counters[_VERSION]
+            # The position's own slot (it is stored at most once), else an empty or stale
+            # slot, else the least recently used one
+            victim = None
+            for slot in range(start, end):
+                if self._keys[slot] == key and self._versions[slot]:
+                    victim = slot
+                    break
+                if victim is None and self._versions[slot] != current:
+                    victim = slot
+            if victim is None:
+                victim = start + int(np.argmin(self._stamps[start:end]))
+                counters[_EVICTIONS] += 1
+            counters[_CLOCK] += 1
+            self._keys[victim] = key
+            self._versions[victim] = current
+            self._stamps[victim] = counters[_CLOCK]
+            self._write(victim, output)
+
+    def _read(self, slot):
+        if self.top_k is None:
+            return torch.from_numpy(self._outputs[slot].astype(np.float32))
+        output = np.full(OUTPUT_SIZE, self._fill[slot], dtype=np.float32)
+        output[self._indices[slot]] = self._values[slot]
+        return torch.from_numpy(output)
+
+    def _write(self, slot, output):
+        if self.top_k is None:
+            self._outputs[slot] = output
+            return
+        top = np.argpartition(output, -self.top_k)[-self.top_k:]
+        self._indices[slot] = top
+        self._values[slot] = output[top]
+        rest = output.sum() - output[top].sum()
+        self._fill[slot] = rest / (OUTPUT_SIZE - self.top_k)
+
+    def clear(self):
+        """Drop every entry and reset the statistics."""
+        with self._lock:
+            self._versions[:] = 0
+            self._counters[[_HITS, _MISSES, _EVICTIONS, _STALE, _CLOCK]] = 0
+
+    def stats(self):
+        """
+        :return: A dict with hits, misses, evictions, stale (lookups that found an entry of an
+                 older model version), hit_rate and size.
+        """
+        hits, misses, evictions, stale = (int(value) for value in self._counters[:4])
+        lookups = hits + misses
+        return {"hits": hits, "misses": misses, "evictions": evictions, "stale": stale,
+                "hit_rate": hits / lookups if lookups else 0.0, "size": len(self)}
+
+    def close(self):
+        """Release the shared memory; the creating process also frees it."""
+        if self._memory is not None:
+            for name, _, _ in self._layout:
+                setattr(self, f"_{name}", None)
+            self._memory.close()
+            if self._owner:
+                self._memory.unlink()
+            self._memory = None
@@ -1,104 +1,154 @@
-import pygame
 import sys
+import threading
 from board import Board  # Make sure board.py is in the same directory
-from player import Player
-import random
-from encoder import *
-from model import *
+import constants
 
-# Initialize Pygame
-pygame.init()
-
-# Constants
-WIDTH, HEIGHT = 800, 800
-ROWS, COLS = 8, 8
-SQUARE_SIZE = WIDTH // COLS
-FPS = 60
-
-# Colors
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-LIGHT_BROWN = (222, 184, 135)
-DARK_BROWN = (139, 69, 19)
-
-# Set up the display
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Chess")
-
-# Font for drawing text on the board
-FONT = pygame.font.SysFont('Arial', 48)
+# pygame (via render.py), torch and the model are loaded by main(), so importing
+# this module is cheap and opens no window.
 
 # white_player, black_player = Player("white"), Player("black")
 
 # Usage example:
 model_path = 'trained_chess_model.pth'
 device = 'cpu'  # or 'cuda' if using GPU
-model = load_model(model_path, device)
-
-def draw_board(win, board):
-    win.fill(BLACK)
-    for row in range(ROWS):
-        for col in range(ROWS):
-            color = LIGHT_BROWN if (row + col) % 2 == 0 else DARK_BROWN
-            pygame.draw.rect(win, color, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-            piece = board.get_piece(row, col)
-            if piece:
-                text = FONT.render(piece.symbol, True, WHITE if piece.color == "white" else BLACK)
-                win.blit(text, (col * SQUARE_SIZE + SQUARE_SIZE // 4, row * SQUARE_SIZE + SQUARE_SIZE // 4))
+
+def create_engine(model):
+    """The search engine selected by constants.GAME_ENGINE, or None to play the policy's choice."""
+    if constants.GAME_ENGINE == "mcts":
+        from mcts import MCTS
+        if constants.EVAL_CACHE_SIZE:
+            # Positions searched on earlier moves are not evaluated again
+            from eval_cache import EvalCache
+            from inference import LocalInference
+            model = LocalInference(model, EvalCache(constants.EVAL_CACHE_SIZE, top_k=constants.EVAL_CACHE_TOP_K))
+        return MCTS(model)
+    if constants.GAME_ENGINE == "alphabeta":
+        from alphabeta import AlphaBeta
+        return AlphaBeta()
+    return None
+
+def choose_move(model, engine, board, color, should_stop):
+    """Engine move for `color`; runs on the engine thread."""
+    from encoder import predict_move
+
+    # Play the opening book's best move while the game is in it
+    if constants.OPENING_BOOK and len(board.move_history) < constants.BOOK_PLIES:
+        from book import load_book
+        move = load_book(constants.OPENING_BOOK).choose(board)
+        if move is not None:
+            print("Book move")
+            return move
+
+    # Search for the move, or take the policy's top move directly
+    if engine is not None:
+        move = engine.search(board, time_limit=constants.ENGINE_TIME_LIMIT, should_stop=should_stop)
+        stats = engine.last_stats
+        if constants.GAME_ENGINE == "mcts":
+            print(f"MCTS: {stats['simulations']} visits, {stats['visits_per_sec']:.0f} visits/s")
+        else:
+            print(f"Alpha-beta: depth {stats['depth']}, {stats['nodes_per_sec']:.0f} nodes/s, "
+                  f"TT hit rate {stats['tt_hit_rate']:.1%}")
+    else:
+        move = predict_move(model, board, color)
+    if move and move[0] == move[1]:
+        # A rook "moving" to its own square vanishes; take the policy's best real move instead
+        legal_moves = [legal for legal in board.get_all_legal_moves(color) if legal[0] != legal[1]]
+        move = predict_move(model, board, color, legal_moves) if legal_moves else None
+    return move
+
+class EngineThread:
+    """Searches a copy of the board in a background thread, so the window stays responsive."""
+    def __init__(self, model, engine, done_event):
+        """
+        :param done_event: pygame event type posted with a `move` attribute when a search finishes.
+        """
+        self.model = model
+        self.engine = engine
+        self.done_event = done_event
+        self._thread = None
+        self._cancel = threading.Event()
+
+    def start(self, board, color):
+        """Start searching; the move arrives as a done_event event."""
+        self.cancel()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(board.copy(), color, self._cancel),
+                                        name="engine", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stop the running search, if any, and wait for the thread to finish."""
+        if self._thread is not None:
+            self._cancel.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, board, color, cancel):
+        import pygame
+
+        move = choose_move(self.model, self.engine, board, color, cancel.is_set)
+        if not cancel.is_set():
+            pygame.event.post(pygame.event.Event(self.done_event, move=move))
 
 def main():
-    clock = pygame.time.Clock()
+    import pygame
+    from model import load_model
+    from render import BoardRenderer
+
+    renderer = BoardRenderer("Chess")
+    model = load_model(model_path, device, constants.MODEL_BACKEND, constants.MODEL_LOGITS)
+    engine_done = pygame.USEREVENT + 1  # Posted by the engine thread when its move is ready
+    engine_thread = EngineThread(model, create_engine(model), engine_done)
+
     board = Board()  # Assuming the Board class initializes the chessboard with pieces
     selected_piece = None  # Tracks the currently selected piece
     selected_pos = None  # Tracks the position (row, col) of the selected piece
     turn = "white"
 
+    renderer.draw(board)
     running = True
     while running:
-      for event in pygame.event.get():
-          if event.type == pygame.QUIT:
-              running = False
-
-          elif turn == "white" and event.type == pygame.MOUSEBUTTONDOWN:
-              x, y = event.pos
-              col, row = x // SQUARE_SIZE, y // SQUARE_SIZE
-              selected_pos = (row, col)
-
-              if selected_piece: # if selected_piece not None, meaning there is a piece selected
-                  x, y = event.pos
-                  end_pos = (y // SQUARE_SIZE, x // SQUARE_SIZE)
-                  move_piece = board.move_piece(turn, selected_piece, end_pos)
-                  print(board.print_board())
-                  if move_piece[0]:
-                      selected_piece = None
-                      point = move_piece[1]
-                      turn = "black"
-                  else:
-                      selected_piece = end_pos
-              else:
-                  selected_piece =  selected_pos
-
-              # print(f"Selected piece at {selected_pos}, the piece is {selected_piece}")
-      if turn == "black":
-          # Here, instead of selecting a random move, use the model to predict the move
-          predicted_move = predict_move(model, board, turn)
-          if predicted_move:
-              start_pos, end_pos = predicted_move
-              if start_pos == end_pos:
-                predicted_move = predict_move(model, board, turn)
-              else:
-                board.move_piece(turn, start_pos, end_pos)
-                turn = "white"
+      # Sleep until something happens: a click, the engine's move or closing the window
+      event = pygame.event.wait()
+      if event.type == pygame.QUIT:
+          running = False
+
+      elif event.type == engine_done and turn == "black":
+          if event.move:
+              start_pos, end_pos = event.move
+              board.move_piece(turn, start_pos, end_pos)
+              turn = "white"
           else:
               print("No legal moves available for black")  # This scenario shouldn't normally happen
 
+      elif turn == "white" and event.type == pygame.MOUSEBUTTONDOWN:
+          selected_pos = renderer.square_at(event.pos)
+
+          if selected_piece: # if selected_piece not None, meaning there is a piece selected
+              end_pos = renderer.square_at(event.pos)
+              move_piece = board.move_piece(turn, selected_piece, end_pos)
+              print(board.print_board())
+              if move_piece[0]:
+                  selected_piece = None
+                  point = move_piece[1]
+                  turn = "black"
+                  if not board.is_game_over():
+                      engine_thread.start(board, turn)
+              else:
+                  selected_piece = end_pos
+          else:
+              selected_piece =  selected_pos
+
+          # print(f"Selected piece at {selected_pos}, the piece is {selected_piece}")
+
       if board.is_game_over():
-        pygame.quit()
-        sys.exit()
+        running = False
+
+      renderer.draw(board)
 
-      draw_board(WIN, board)
-      pygame.display.update()
-      clock.tick(FPS)
+    engine_thread.cancel()
+    renderer.close()
+    sys.exit()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,306 @@
+# inference.py
+"""
+Batched model inference for many concurrent games.
+
+Every evaluator takes the (8, 8) int8 piece codes of one position (see
+encoder.board_to_codes) and returns the model output for it as a tensor of
+shape (4096,):
+
+- LocalInference runs the model immediately with a batch of one. It has no
+  threads or queues and is the stand-in to use in tests.
+- InferenceServer collects requests from threads (evaluate/submit),
+  coroutines (evaluate_async) or worker processes (create_clients) and runs
+  them through the model in batches of up to max_batch, waiting at most
+  max_wait seconds for a batch to fill up.
+
+Both take an optional EvalCache (see eval_cache.py) and only run the model
+for positions missing from it; a shared cache is also read by the clients
+in the worker processes before they send a request.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+from encoder import encode_boards
+from eval_cache import position_key
+
+# Upper bounds (milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, float("inf"))
+
+
+class LocalInference:
+    """Synchronous in-process evaluator with the same interface as InferenceServer."""
+    def __init__(self, model, cache=None):
+        """
+        :param cache: Optional EvalCache for the model's outputs.
+        """
+        self.model = model
+        self.model.eval()
+        self.logits = getattr(model, "logits", False)  # Outputs are logits, see model.load_model
+        self.cache = cache
+
+    def evaluate(self, codes):
+        return self.evaluate_batch([codes])[0]
+
+    def evaluate_batch(self, codes):
+        """Evaluate a list of positions in one forward pass; returns an (N, 4096) tensor."""
+        if self.cache is None:
+            with torch.no_grad():
+                return self.model(encode_boards(codes))
+        version = self.cache.sync(self.model)
+        keys = [position_key(position) for position in codes]
+        outputs = [self.cache.get(key) for key in keys]
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if missing:
+            with torch.no_grad():
+                computed = self.model(encode_boards([codes[i] for i in missing]))
+            for i, output in zip(missing, computed):
+                outputs[i] = output
+                self.cache.put(keys[i], output, version)
+        return torch.stack(outputs)
+
+    def submit(self, codes):
+        future = Future()
+        future.set_result(self.evaluate(codes))
+        return future
+
+    async def evaluate_async(self, codes):
+        return self.evaluate(codes)
+
+
+class InferenceServer:
+    """
+    Batches position requests from many games into single forward passes.
+
+    Usage:
+        with InferenceServer(model, max_batch=64, max_wait=0.002) as server:
+            output = server.evaluate(codes)          # from any thread
+            output = await server.evaluate_async(codes)  # from a coroutine
+        print(server.stats())
+    """
+    def __init__(self, model, max_batch=64, max_wait=0.002, cache=None):
+        """
+        :param model: The ChessModel to run.
+        :param max_batch: Largest number of positions evaluated in one forward pass.
+        :param max_wait: Longest time in seconds the first request of a batch waits for more to arrive.
+        :param cache: Optional EvalCache for the model's outputs; pass a shared one to let
+                      the clients of create_clients use it as well.
+        """
+        self.model = model
+        self.model.eval()
+        self.logits = getattr(model, "logits", False)  # Outputs are logits, see model.load_model
+        self.cache = cache
+        if cache is not None:
+            cache.sync(model)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._requests = queue.Queue()
+        self._buffer = torch.zeros((max_batch, 12, 8, 8), dtype=torch.float32)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Cross-process plumbing, created by create_clients
+        self._remote_requests = None
+        self._remote_responses = []
+        self._listener = None
+
+        self.batch_sizes = Counter()
+        self.latency_counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.requests = 0
+        self.batches = 0
+        self.total_latency = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="inference-server", daemon=True)
+            self._thread.start()
+        if self._remote_requests is not None and self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name="inference-listener", daemon=True)
+            self._listener.start()
+
+    def stop(self):
+        if self._listener is not None:
+            self._remote_requests.put(None)
+            self._listener.join()
+            self._listener = None
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, codes):
+        """
+        Queue one position for evaluation.
+
+        :param codes: (8, 8) int8 piece-code array.
+        :return: A concurrent.futures.Future resolving to the (4096,) output tensor.
+        """
+        return self._submit(codes)
+
+    def _submit(self, codes, lookup=True):
+        future = Future()
+        key = position_key(codes) if self.cache is not None else None
+        output = self.cache.get(key) if lookup and key is not None else None
+        if output is not None:
+            future.set_result(output)
+        else:
+            self._requests.put((codes, future, time.perf_counter(), key))
+        return future
+
+    def evaluate(self, codes):
+        """Evaluate one position, blocking until its batch has run."""
+        return self.submit(codes).result()
+
+    async def evaluate_async(self, codes):
+        """Evaluate one position from a coroutine without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(codes))
+
+    def create_clients(self, count):
+        """
+        Create evaluators for worker processes.
+
+        Call this before starting the workers (the clients hold multiprocessing queues, which
+        can only be passed to processes at creation), and call start() afterwards.
+
+        :param count: Number of clients, one per worker process.
+        :return: A list of RemoteInferenceClient.
+        """
+        if self._remote_requests is None:
+            self._remote_requests = multiprocessing.Queue()
+        clients = []
+        for _ in range(count):
+            clients.append(RemoteInferenceClient(len(self._remote_responses), self._remote_requests,
+                                                 multiprocessing.Queue(), self.logits,
+                                                 self.cache if self.cache is not None and self.cache.shared else None))
+            self._remote_responses.append(clients[-1].responses)
+        return clients
+
+    def stats(self):
+        """
+        Batch-size and latency statistics since the server was created.
+
+        :return: A dict with request and batch counts, mean batch size and latency, the
+                 batch-size histogram and the latency histogram (bucket upper bound in ms -> count).
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "mean_latency_ms": 1000 * self.total_latency / self.requests if self.requests else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "latency_ms": dict(zip(LATENCY_BUCKETS_MS, self.latency_counts)),
+            }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            request = self._requests.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self._requests.get(timeout=timeout) if timeout > 0 else self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self._evaluate_batch(batch)
+
+    def _evaluate_batch(self, batch):
+        try:
+            version = self.cache.sync(self.model) if self.cache is not None else None
+            inputs = self._buffer[:len(batch)]
+            encode_boards(np.stack([codes for codes, _, _, _ in batch]), out=inputs)
+            with torch.no_grad():
+                outputs = self.model(inputs)
+        except Exception as error:
+            for _, future, _, _ in batch:
+                future.set_exception(error)
+            return
+
+        now = time.perf_counter()
+        with self._lock:
+            self.requests += len(batch)
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+            for _, _, submitted, _ in batch:
+                latency = now - submitted
+                self.total_latency += latency
+                for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                    if latency * 1000 <= bound:
+                        self.latency_counts[i] += 1
+                        break
+        for i, (_, future, _, key) in enumerate(batch):
+            if key is not None:
+                self.cache.put(key, outputs[i], version)
+            future.set_result(outputs[i])
+
+    def _listen(self):
+        """Forward requests from worker processes to the batching thread."""
+        while True:
+            message = self._remote_requests.get()
+            if message is None:
+                break
+            client_id, request_id, codes = message
+            # The client has already looked the position up in the shared cache
+            self._submit(codes, lookup=False).add_done_callback(
+                lambda done, client_id=client_id, request_id=request_id:
+                self._respond(client_id, request_id, done))
+
+    def _respond(self, client_id, request_id, future):
+        error = future.exception()
+        result = repr(error) if error is not None else future.result().numpy()
+        self._remote_responses[client_id].put((request_id, result))
+
+
+class RemoteInferenceClient:
+    """Evaluator used inside a worker process; forwards requests to an InferenceServer."""
+    def __init__(self, client_id, requests, responses, logits=False, cache=None):
+        self.client_id = client_id
+        self.requests = requests
+        self.responses = responses
+        self.logits = logits
+        self.cache = cache  # Shared EvalCache filled by the server
+        self._request_ids = itertools.count()
+
+    def evaluate(self, codes):
+        if self.cache is not None:
+            output = self.cache.get(position_key(codes))
+            if output is not None:
+                return output
+        request_id = next(self._request_ids)
+        self.requests.put((self.client_id, request_id, np.ascontiguousarray(codes, dtype=np.int8)))
+        response_id, output = self.responses.get()
+        assert response_id == request_id
+        if isinstance(output, str):
+            raise RuntimeError(f"Inference server failed: {output}")
+        return torch.from_numpy(output)
+
+    def submit(self, codes):
+        future = Future()
+        future.set_result(self.evaluate(codes))
+        return future
+
+    async def evaluate_async(self, codes):
+        return self.evaluate(codes)
@@ -0,0 +1,178 @@
+# instrument.py
+"""
+Opt-in timers around the hot paths of self-play and training.
+
+Nothing is patched until a Session starts, so there is no cost when it is
+off. While it runs, the functions in TARGETS are replaced by timing wrappers
+(the originals are restored on stop), and optionally a cProfile profile or a
+Chrome trace (open in chrome://tracing or Perfetto) is written as well.
+
+Usage:
+    with instrument.Session(trace_path="trace.json") as session:
+        selfplay.generate_self_play_data(model, 10, workers=1)
+    # the summary is printed on exit; session.stats() returns it as a dict
+
+Only the current process is measured; use workers=1 to see self-play inside it.
+"""
+import cProfile
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+# (name, module, attribute, positions handled per call as a function of the call's args or None for 1).
+# Targets must not call each other, or the time of the inner one would be counted twice: Board.move_piece
+# is covered by the Board.apply_move it makes.
+TARGETS = [
+    ("Board.get_all_legal_moves", "board", "Board.get_all_legal_moves", None),
+    ("Board.apply_move", "board", "Board.apply_move", None),
+    ("encode_board_state", "encoder", "encode_board_state", None),
+    ("encode_boards", "encoder", "encode_boards", lambda args: len(args[0])),
+    ("ChessEnv.get_board_state", "chess_env", "ChessEnv.get_board_state", None),
+    ("ChessEnv.draw", "chess_env", "ChessEnv.draw", None),
+    ("ChessModel.forward", "model", "ChessModel.forward", lambda args: args[1].shape[0]),
+    ("ChessEnv.pause", "chess_env", "ChessEnv.pause", lambda args: 0),
+]
+
+_active = None
+
+
+class Session:
+    """Patches timers into the TARGETS for the duration of a run."""
+    def __init__(self, targets=None, trace_path=None, profile_path=None, verbose=True):
+        """
+        :param targets: Names from TARGETS to time, default all of them.
+        :param trace_path: Write a Chrome trace-event JSON file of every timed call here.
+        :param profile_path: Run cProfile over the session and dump its stats here (see pstats).
+        :param verbose: Print the summary when the session stops.
+        """
+        self.targets = [target for target in TARGETS if targets is None or target[0] in targets]
+        self.trace_path = trace_path
+        self.profile_path = profile_path
+        self.verbose = verbose
+        self.durations = {name: [] for name, _, _, _ in self.targets}
+        self.positions = {name: 0 for name, _, _, _ in self.targets}
+        self.events = [] if trace_path else None
+        self._patches = []
+        self._profiler = None
+        self.start_time = self.stop_time = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("Another instrumentation session is already running")
+        _active = self
+        for name, module_name, attribute, count in self.targets:
+            self._patch(name, importlib.import_module(module_name), attribute, count)
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        global _active
+        if _active is not self:
+            return
+        self.stop_time = time.perf_counter()
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+        for owner, attribute, original in reversed(self._patches):
+            setattr(owner, attribute, original)
+        self._patches = []
+        _active = None
+
+        if self.trace_path:
+            self.write_trace(self.trace_path)
+        if self.verbose:
+            print(self.summary())
+
+    def _patch(self, name, module, attribute, count):
+        durations = self.durations[name]
+        positions = self.positions
+        events = self.events
+        clock = time.perf_counter
+
+        if "." in attribute:
+            class_name, method = attribute.split(".")
+            owner = getattr(module, class_name)
+            original = owner.__dict__[method]
+            owners = [(owner, method)]
+        else:
+            original = getattr(module, attribute)
+            # `from module import function` copies the function into other modules too
+            owners = [(loaded, attribute) for loaded in list(sys.modules.values())
+                      if getattr(loaded, "__dict__", {}).get(attribute) is original]
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                durations.append(elapsed)
+                positions[name] += 1 if count is None else count(args)
+                if events is not None:
+                    events.append((name, start, elapsed, threading.get_ident()))
+
+        for owner, attribute_name in owners:
+            self._patches.append((owner, attribute_name, getattr(owner, attribute_name)))
+            setattr(owner, attribute_name, timed)
+
+    def stats(self):
+        """
+        Per-target timings.
+
+        :return: A dict name -> {calls, total, mean, p99 (seconds), share of wall time,
+                 positions, positions_per_sec (positions / total time in the target)}.
+        """
+        wall = (self.stop_time or time.perf_counter()) - self.start_time
+        result = {}
+        for name, durations in self.durations.items():
+            if not durations:
+                continue
+            ordered = sorted(durations)
+            total = sum(ordered)
+            result[name] = {
+                "calls": len(ordered),
+                "total": total,
+                "mean": total / len(ordered),
+                "p99": ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))],
+                "share": total / wall if wall > 0 else 0.0,
+                "positions": self.positions[name],
+                "positions_per_sec": self.positions[name] / total if total > 0 else 0.0,
+            }
+        return result
+
+    def summary(self):
+        wall = (self.stop_time or time.perf_counter()) - self.start_time
+        lines = [f"Instrumented run: {wall:.3f}s wall time",
+                 f"{'target':<28}{'calls':>10}{'total s':>10}{'mean us':>11}{'p99 us':>11}{'% wall':>8}"
+                 f"{'positions/s':>13}"]
+        for name, entry in sorted(self.stats().items(), key=lambda item: -item[1]["total"]):
+            rate = f"{entry['positions_per_sec']:.0f}" if entry["positions"] else "-"
+            lines.append(f"{name:<28}{entry['calls']:>10}{entry['total']:>10.3f}{entry['mean'] * 1e6:>11.1f}"
+                         f"{entry['p99'] * 1e6:>11.1f}{entry['share']:>8.1%}{rate:>13}")
+        return "\n".join(lines)
+
+    def write_trace(self, path):
+        """Write the timed calls as Chrome trace events (complete "X" events, microseconds)."""
+        pid = os.getpid()
+        trace = {"traceEvents": [
+            {"name": name, "ph": "X", "ts": (start - self.start_time) * 1e6, "dur": elapsed * 1e6,
+             "pid": pid, "tid": tid}
+            for name, start, elapsed, tid in self.events
+        ]}
+        with open(path, "w") as f:
+            json.dump(trace, f)
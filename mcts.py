@@ -0,0 +1,317 @@
+# mcts.py
+"""
+PUCT Monte Carlo tree search on top of ChessModel.
+
+The model's 4096-way output supplies the move priors; leaves are scored by
+material (Piece.point) from the point of view of the side to move, and a
+captured king is a loss. Nodes live in flat NumPy arrays (children of a node
+occupy one contiguous block), not in per-node Python objects. Each search
+iteration descends to up to `batch_size` leaves, using virtual loss to
+spread the descents out, and evaluates them with a single forward pass. The
+subtree of the position actually reached is kept between moves.
+"""
+import math
+import time
+
+import numpy as np
+import torch
+
+from encoder import board_to_codes, encode_boards, index_to_move, move_to_index
+
+_ROOT = 0
+
+
+class MCTS:
+    def __init__(self, model, batch_size=16, c_puct=1.5, virtual_loss=1.0, material_scale=10.0,
+                 capacity=65536, logits=None):
+        """
+        :param model: A ChessModel, or an evaluator from inference.py.
+        :param batch_size: Leaves collected per forward pass.
+        :param c_puct: Exploration constant.
+        :param virtual_loss: Loss temporarily added to every node on a pending path.
+        :param material_scale: Leaf value is tanh(material difference / material_scale).
+        :param capacity: Initial node capacity; the arrays grow as needed.
+        :param logits: True if the model returns logits (see model.load_model), None to ask the model.
+        """
+        self.model = model
+        self.logits = getattr(model, "logits", False) if logits is None else logits
+        self.batch_size = batch_size
+        self.c_puct = c_puct
+        self.virtual_loss = virtual_loss
+        self.material_scale = material_scale
+        self._allocate(capacity)
+        self.size = 0
+        self.last_stats = {}
+
+    def _allocate(self, capacity):
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.move = np.zeros(capacity, dtype=np.int16)          # Move index leading to the node
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int16)
+        self.visits = np.zeros(capacity, dtype=np.float64)       # Includes pending virtual visits
+        self.value_sum = np.zeros(capacity, dtype=np.float64)    # From the view of the side that moved into the node
+        self.prior = np.zeros(capacity, dtype=np.float32)
+        self.hash = np.zeros(capacity, dtype=np.uint64)
+        self.expanded = np.zeros(capacity, dtype=bool)
+        self.pending = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, needed):
+        capacity = len(self.parent)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ("parent", "move", "first_child", "num_children", "visits", "value_sum",
+                     "prior", "hash", "expanded", "pending"):
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            if name in ("parent", "first_child"):
+                new[:] = -1
+            new[:capacity] = old
+            setattr(self, name, new)
+
+    def reset(self, board=None):
+        """Drop the tree; with a board, start a new one rooted at its position."""
+        self.size = 0
+        if board is not None:
+            self._new_node(-1, 0, board.hash)
+
+    def _new_node(self, parent, move, key):
+        self._grow(self.size + 1)
+        index = self.size
+        self.parent[index] = parent
+        self.move[index] = move
+        self.first_child[index] = -1
+        self.num_children[index] = 0
+        self.visits[index] = 0
+        self.value_sum[index] = 0
+        self.prior[index] = 0
+        self.hash[index] = key
+        self.expanded[index] = False
+        self.pending[index] = False
+        self.size += 1
+        return index
+
+    def search(self, board, nodes=None, time_limit=None, should_stop=None):
+        """
+        Search the board's position and return the most visited move.
+
+        The tree from the previous search is reused if the position is the previous root
+        or one or two plies below it.
+
+        :param board: The Board to search (side to move is board.white_turn); left unchanged.
+        :param nodes: Stop after this many simulations (default 800 if no time_limit).
+        :param time_limit: Stop after this many seconds.
+        :param should_stop: Optional callable; the search stops as soon as it returns True.
+        :return: The chosen move ((start_row, start_col), (end_row, end_col)), or None without legal moves.
+        """
+        if nodes is None and time_limit is None:
+            nodes = 800
+        reused = self._find_root(board)
+        start = time.perf_counter()
+        simulations = 0
+        batches = 0
+        while True:
+            if nodes is not None and simulations >= nodes:
+                break
+            if time_limit is not None and time.perf_counter() - start >= time_limit:
+                break
+            if should_stop is not None and should_stop():
+                break
+            count = self.batch_size if nodes is None else min(self.batch_size, nodes - simulations)
+            if not self.expanded[_ROOT]:
+                count = 1  # Every descent would stop at the unexpanded root
+            simulations += self._simulate_batch(board, count)
+            batches += 1
+            if self.expanded[_ROOT] and self.num_children[_ROOT] == 0:
+                break  # No legal moves at the root
+
+        seconds = time.perf_counter() - start
+        self.last_stats = {
+            "simulations": simulations,
+            "batches": batches,
+            "seconds": seconds,
+            "visits_per_sec": simulations / seconds if seconds > 0 else 0.0,
+            "tree_size": self.size,
+            "reused_visits": reused,
+        }
+        return self.best_move()
+
+    def best_move(self):
+        moves, visits = self.root_policy()
+        if not moves:
+            return None
+        return moves[int(np.argmax(visits))]
+
+    def root_policy(self):
+        """
+        Visit counts of the root's children.
+
+        :return: A tuple (moves, visits): the legal moves at the root and a NumPy array of their visit counts.
+        """
+        if self.size == 0 or not self.expanded[_ROOT]:
+            return [], np.zeros(0)
+        first, count = self.first_child[_ROOT], self.num_children[_ROOT]
+        moves = [index_to_move(index) for index in self.move[first:first + count]]
+        return moves, self.visits[first:first + count].copy()
+
+    def _find_root(self, board):
+        """Re-root the tree at the board's position if it is in the tree; return the visits kept."""
+        if self.size:
+            key = np.uint64(board.hash)
+            if self.hash[_ROOT] == key:
+                return int(self.visits[_ROOT])
+            # Look one and two plies down (our move, then the opponent's reply)
+            frontier = [_ROOT]
+            for _ in range(2):
+                children = []
+                for node in frontier:
+                    first, count = self.first_child[node], self.num_children[node]
+                    if first >= 0:
+                        children.extend(range(first, first + count))
+                for child in children:
+                    if self.hash[child] == key:
+                        self._reroot(child)
+                        return int(self.visits[_ROOT])
+                frontier = children
+        self.reset(board)
+        return 0
+
+    def _reroot(self, new_root):
+        """Compact the subtree below new_root to the front of the arrays."""
+        order = [new_root]
+        new_first_child = {}
+        i = 0
+        while i < len(order):
+            node = order[i]
+            first, count = self.first_child[node], self.num_children[node]
+            if first >= 0:
+                new_first_child[node] = len(order)
+                order.extend(range(first, first + count))
+            i += 1
+
+        order = np.array(order, dtype=np.int64)
+        remap = np.full(self.size, -1, dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        for name in ("move", "num_children", "visits", "value_sum", "prior", "hash", "expanded", "pending"):
+            array = getattr(self, name)
+            array[:len(order)] = array[order]
+        parents = self.parent[order]
+        self.parent[:len(order)] = np.where(parents >= 0, remap[np.maximum(parents, 0)], -1)
+        self.parent[0] = -1
+        self.first_child[:len(order)] = [new_first_child.get(int(node), -1) for node in order]
+        self.size = len(order)
+
+    def _select_child(self, node):
+        first, count = self.first_child[node], self.num_children[node]
+        visits = self.visits[first:first + count]
+        q = np.where(visits > 0, self.value_sum[first:first + count] / np.maximum(visits, 1), 0.0)
+        u = self.c_puct * self.prior[first:first + count] * math.sqrt(self.visits[node] + 1) / (1 + visits)
+        return first + int(np.argmax(q + u))
+
+    def _simulate_batch(self, board, count):
+        """Run up to `count` simulations with one forward pass; return how many were run."""
+        pending = []  # (leaf, path, legal moves, child hashes, codes, value) waiting for the model
+        backups = []  # (path, value, leaf); value None for a leaf already pending in this batch
+        for _ in range(count):
+            path = [_ROOT]
+            node = _ROOT
+            made = 0
+            while self.expanded[node] and self.num_children[node] > 0:
+                node = self._select_child(node)
+                path.append(node)
+                board.apply_move(*index_to_move(self.move[node]))
+                made += 1
+                if self.pending[node]:
+                    break
+
+            for visited in path:
+                self.visits[visited] += self.virtual_loss
+                self.value_sum[visited] -= self.virtual_loss
+
+            color = "white" if board.white_turn else "black"
+            if self.pending[node]:
+                backups.append((path, None, node))
+            elif board.is_game_over():
+                # Normally the side to move has lost its king; a knight may also take its own king
+                backups.append((path, -1.0 if board.king_squares[color] is None else 1.0, node))
+            elif self.expanded[node]:
+                backups.append((path, 0.0, node))  # Expanded without legal moves
+            else:
+                legal_moves = board.get_all_legal_moves(color)
+                if not legal_moves:
+                    self.expanded[node] = True
+                    backups.append((path, 0.0, node))
+                else:
+                    opponent = "black" if color == "white" else "white"
+                    value = math.tanh((board.get_material(color) - board.get_material(opponent)) / self.material_scale)
+                    hashes = [board.hash_after(*move) for move in legal_moves]
+                    pending.append((node, path, legal_moves, hashes, board_to_codes(board), value))
+                    self.pending[node] = True
+
+            for _ in range(made):
+                board.undo_move()
+
+        if pending:
+            outputs = self._evaluate([codes for _, _, _, _, codes, _ in pending])
+            leaf_values = {}
+            for i, (node, path, legal_moves, hashes, _, value) in enumerate(pending):
+                self._expand(node, legal_moves, hashes, outputs[i])
+                leaf_values[node] = value
+                self._backup(path, value)
+            for path, value, node in backups:
+                self._backup(path, leaf_values.get(node, 0.0) if value is None else value)
+        else:
+            for path, value, node in backups:
+                self._backup(path, 0.0 if value is None else value)
+        return len(pending) + len(backups)
+
+    def _evaluate(self, codes):
+        if isinstance(self.model, torch.nn.Module):
+            with torch.no_grad():
+                return self.model(encode_boards(codes))
+        if hasattr(self.model, "evaluate_batch"):
+            return self.model.evaluate_batch(codes)
+        # Submit every leaf before waiting so a server can batch them together
+        futures = [self.model.submit(position) for position in codes]
+        return torch.stack([future.result() for future in futures])
+
+    def _expand(self, node, legal_moves, hashes, output):
+        indices = [move_to_index(move) for move in legal_moves]
+        if self.logits:
+            priors = torch.softmax(output[indices].float(), dim=0).numpy().astype(np.float64)
+        else:
+            priors = output[indices].float().clamp_min(0).numpy().astype(np.float64)
+        total = priors.sum()
+        priors = priors / total if total > 0 else np.full(len(indices), 1.0 / len(indices))
+
+        first = self.size
+        self._grow(first + len(indices))
+        end = first + len(indices)
+        self.parent[first:end] = node
+        self.move[first:end] = indices
+        self.first_child[first:end] = -1
+        self.num_children[first:end] = 0
+        self.visits[first:end] = 0
+        self.value_sum[first:end] = 0
+        self.prior[first:end] = priors
+        self.hash[first:end] = np.array(hashes, dtype=np.uint64)
+        self.expanded[first:end] = False
+        self.pending[first:end] = False
+        self.size = end
+
+        self.first_child[node] = first
+        self.num_children[node] = len(indices)
+        self.expanded[node] = True
+        self.pending[node] = False
+
+    def _backup(self, path, value):
+        """
+        Propagate a leaf value up the path, removing the path's virtual loss.
+
+        :param value: Value of the leaf position for its side to move.
+        """
+        for node in reversed(path):
+            # Each node's value is kept from the view of the side that moved into it
+            value = -value
+            self.visits[node] += 1 - self.virtual_loss
+            self.value_sum[node] += value + self.virtual_loss
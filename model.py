@@ -1,9 +1,20 @@
+import warnings
+
 import torch
 import torch.nn as nn
 
+# Inference backends of load_model
+BACKENDS = ("eager", "script", "compile", "int8", "channels_last")
+
 class ChessModel(nn.Module):
-    def __init__(self):
+    def __init__(self, logits=False):
+        """
+        :param logits: Return raw logits instead of softmax probabilities. Argmax and
+                       masked sampling (see encoder.py) give the same moves either way.
+        """
         super(ChessModel, self).__init__()
+        self.logits = logits
+        self.channels_last = False  # Convert inputs to channels-last to match the conv weights
         self.conv1 = nn.Conv2d(12, 64, kernel_size=3, stride=1, padding=1)
         self.conv2 = nn.Conv2d(64, 128, kernel_size=3, stride=1, padding=1)
         self.fc1 = nn.Linear(128 * 8 * 8, 1024)
@@ -11,24 +22,29 @@ class ChessModel(nn.Module):
         self.softmax = nn.Softmax(dim=1)
 
     def forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         x = torch.relu(self.conv1(x))
         x = torch.relu(self.conv2(x))
-        x = x.view(-1, 128 * 8 * 8)
+        x = x.reshape(-1, 128 * 8 * 8)  # A copy in channels-last layout, a view otherwise
         x = torch.relu(self.fc1(x))
         x = self.fc2(x)
-        x = self.softmax(x)
+        if not self.logits:
+            x = self.softmax(x)
         return x
 
-def load_model(model_path, device='cpu'):
+def load_model(model_path, device='cpu', backend="eager", logits=False):
     """
     Loads a trained ChessModel from the specified file.
 
     :param model_path: Path to the file containing the saved model state.
     :param device: The device to load the model onto ('cpu' or 'cuda').
-    :return: The loaded ChessModel instance.
+    :param backend: Inference backend, one of BACKENDS (see optimize_model).
+    :param logits: Skip the final softmax; see ChessModel.
+    :return: The loaded model in evaluation mode, ready for inference only.
     """
     # Initialize the model architecture
-    model = ChessModel()
+    model = ChessModel(logits=logits)
 
     # Load the saved state_dict into the model
     model.load_state_dict(torch.load(model_path, map_location=device))
@@ -36,4 +52,40 @@ def load_model(model_path, device='cpu'):
     # Set the model to evaluation mode
     model.eval()
 
+    return optimize_model(model, backend)
+
+def optimize_model(model, backend="eager"):
+    """
+    Prepare an evaluation-mode ChessModel for fast inference.
+
+    - "eager": the model itself.
+    - "script": traced and frozen TorchScript, which fuses the layers.
+    - "compile": torch.compile (needs a C++ compiler on CPU; compiles on the first call).
+    - "int8": fc1 and fc2, which hold nearly all of the weights and FLOPs, quantized to int8
+      with dynamic activation quantization (CPU only). Move choices can differ from the
+      float model where two moves score almost the same.
+    - "channels_last": conv weights and inputs in channels-last memory layout.
+
+    :return: A module with the same inputs and outputs; its `logits` and `backend`
+             attributes say what it returns and how it was built.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend: {backend}")
+    logits = model.logits
+    if backend == "script":
+        example = torch.zeros(1, 12, 8, 8, device=next(model.parameters()).device)
+        with warnings.catch_warnings(), torch.no_grad():
+            warnings.simplefilter("ignore", FutureWarning)  # TorchScript is deprecated but still the fastest here
+            model = torch.jit.optimize_for_inference(torch.jit.freeze(torch.jit.trace(model, example)))
+        model.logits = logits
+    elif backend == "compile":
+        model = torch.compile(model)
+    elif backend == "int8":
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # Quantized tensor creation deprecation notice
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    elif backend == "channels_last":
+        model = model.to(memory_format=torch.channels_last)
+        model.channels_last = True
+    model.backend = backend
     return model
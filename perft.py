@@ -0,0 +1,213 @@
+# perft.py
+"""
+Perft: walk the move tree to a fixed depth and count the leaf nodes.
+
+Used both as a correctness check for Board.get_all_legal_moves/move_piece
+(node counts must match the reference values below) and as a throughput
+benchmark (nodes per second).
+
+Node counts follow this repo's own move rules (see piece.py), not standard
+chess, so they differ from published perft tables. A position where a king
+has been captured is terminal and has no children.
+
+Usage:
+    python perft.py                       # run the test suite
+    python perft.py --depth 4 --divide    # split the start position per root move
+    python perft.py --fen "<fen>" --depth 3
+    python perft.py --save-baseline perft_baseline.json
+    python perft.py --baseline perft_baseline.json   # fail if slower than stored
+"""
+import argparse
+import json
+import sys
+import time
+
+from board import Board, BACKENDS
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Reference node counts per depth (index 0 is depth 1), produced by the
+# original square-by-square "scan" backend.
+POSITIONS = [
+    {
+        "name": "start",
+        "fen": START_FEN,
+        "nodes": [25, 625, 16379, 428174],
+    },
+    {
+        "name": "kiwipete",
+        "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "nodes": [48, 1996, 92371, 3754630],
+    },
+    {
+        "name": "endgame",
+        "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "nodes": [13, 175, 2324, 30064],
+    },
+    {
+        "name": "tactical",
+        "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        "nodes": [39, 1547, 57550, 2299290],
+    },
+]
+
+
+def other(color):
+    return "black" if color == "white" else "white"
+
+
+def perft(board, color, depth):
+    """
+    Count the leaf nodes of the move tree below the current position.
+
+    :param board: The Board to search; it is restored before returning.
+    :param color: The side to move, "white" or "black".
+    :param depth: Number of plies to walk.
+    :return: The number of positions reached after exactly `depth` plies.
+    """
+    if depth == 0:
+        return 1
+    if board.is_game_over():
+        return 0
+
+    nodes = 0
+    opponent = other(color)
+    for start, end in board.get_all_legal_moves(color):
+        board.move_piece(color, start, end)
+        nodes += perft(board, opponent, depth - 1)
+        board.undo_move()
+    return nodes
+
+
+def divide(board, color, depth):
+    """
+    Run perft separately below every root move.
+
+    :return: A list of (move, nodes) pairs in move generation order.
+    """
+    results = []
+    if board.is_game_over():
+        return results
+    for start, end in board.get_all_legal_moves(color):
+        board.move_piece(color, start, end)
+        results.append(((start, end), perft(board, other(color), depth - 1)))
+        board.undo_move()
+    return results
+
+
+def run_position(fen, max_depth, backend="bitboard"):
+    """
+    Run perft for every depth from 1 to max_depth on one position.
+
+    :return: A list of dicts with depth, nodes, seconds and nps.
+    """
+    board = Board.from_fen(fen, backend)
+    color = "white" if board.is_white_turn() else "black"
+    results = []
+    for depth in range(1, max_depth + 1):
+        start = time.perf_counter()
+        nodes = perft(board, color, depth)
+        seconds = time.perf_counter() - start
+        results.append({"depth": depth, "nodes": nodes, "seconds": seconds,
+                        "nps": nodes / seconds if seconds > 0 else 0.0})
+    return results
+
+
+def run_suite(max_depth, backend="bitboard"):
+    """
+    Run every position in POSITIONS and compare against the reference counts.
+
+    :return: A tuple (total nodes, total seconds, list of mismatch descriptions).
+    """
+    total_nodes = 0
+    total_seconds = 0.0
+    mismatches = []
+    for position in POSITIONS:
+        depth = min(max_depth, len(position["nodes"]))
+        print(f"{position['name']}: {position['fen']}")
+        for result in run_position(position["fen"], depth, backend):
+            expected = position["nodes"][result["depth"] - 1]
+            status = "ok" if result["nodes"] == expected else f"MISMATCH (expected {expected})"
+            print(f"  depth {result['depth']}: {result['nodes']:>10} nodes "
+                  f"{result['seconds']:8.3f}s {result['nps']:>12.0f} nps  {status}")
+            if result["nodes"] != expected:
+                mismatches.append(f"{position['name']} depth {result['depth']}: "
+                                  f"got {result['nodes']}, expected {expected}")
+            total_nodes += result["nodes"]
+            total_seconds += result["seconds"]
+    return total_nodes, total_seconds, mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts and move generator benchmark.")
+    parser.add_argument("--fen", help="Run a single position instead of the test suite.")
+    parser.add_argument("--depth", type=int, default=3, help="Maximum depth (default: 3).")
+    parser.add_argument("--divide", action="store_true", help="Print node counts per root move.")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    parser.add_argument("--baseline", help="JSON file with a stored nps baseline; fail if slower.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed fractional slowdown against the baseline (default: 0.2).")
+    parser.add_argument("--save-baseline", help="Write the measured suite nps to this JSON file.")
+    args = parser.parse_args(argv)
+
+    if args.fen or args.divide:
+        fen = args.fen or START_FEN
+        if args.divide:
+            board = Board.from_fen(fen, args.backend)
+            color = "white" if board.is_white_turn() else "black"
+            start = time.perf_counter()
+            results = divide(board, color, args.depth)
+            seconds = time.perf_counter() - start
+            for move, nodes in results:
+                print(f"{move}: {nodes}")
+            total = sum(nodes for _, nodes in results)
+            print(f"moves: {len(results)} nodes: {total} time: {seconds:.3f}s "
+                  f"nps: {total / seconds if seconds > 0 else 0:.0f}")
+        else:
+            for result in run_position(fen, args.depth, args.backend):
+                print(f"depth {result['depth']}: {result['nodes']:>10} nodes "
+                      f"{result['seconds']:8.3f}s {result['nps']:>12.0f} nps")
+        return 0
+
+    nodes, seconds, mismatches = run_suite(args.depth, args.backend)
+    nps = nodes / seconds if seconds > 0 else 0.0
+    print(f"total: {nodes} nodes in {seconds:.3f}s, {nps:.0f} nps")
+
+    # Shallow searches run at a different speed, so baselines are kept per depth
+    baseline_key = f"{args.backend}/depth{args.depth}"
+    failed = False
+    for mismatch in mismatches:
+        print(f"FAIL: {mismatch}")
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        expected_nps = baseline.get(baseline_key)
+        if expected_nps is None:
+            print(f"FAIL: no baseline for {baseline_key} in {args.baseline}")
+            failed = True
+        elif nps < expected_nps * (1 - args.tolerance):
+            print(f"FAIL: {nps:.0f} nps is below baseline {expected_nps:.0f} nps "
+                  f"(tolerance {args.tolerance:.0%})")
+            failed = True
+        else:
+            print(f"baseline: {nps:.0f} nps vs {expected_nps:.0f} nps, ok")
+
+    if args.save_baseline:
+        baseline = {}
+        try:
+            with open(args.save_baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            pass
+        baseline[baseline_key] = nps
+        with open(args.save_baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"saved baseline to {args.save_baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
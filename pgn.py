@@ -0,0 +1,371 @@
+# pgn.py
+"""
+Streaming PGN import into the on-disk training format (see shards.py).
+
+Games are read one at a time, so files of any size can be processed, and
+moves in Standard Algebraic Notation are resolved with the ordinary rules of
+chess (including castling, promotion and en passant), since real games are
+played under them. Every position before a move becomes one record whose
+target is the played move's from x to-square index (castling is recorded as
+the king's move).
+
+Large files are split into byte ranges that worker processes convert in
+parallel; a game belongs to the range in which its [Event tag starts.
+
+Usage:
+    python pgn.py games.pgn --out pgn_data --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import bitboard
+import constants
+from board import Board
+from piece import Pawn, Knight, Bishop, Rook, Queen, King
+from encoder import board_to_codes
+from shards import RECORD_DTYPE, ShardWriter
+
+RESULTS = {"1-0": 1, "0-1": -1, "1/2-1/2": 0, "*": 0}
+
+PROMOTIONS = {"Q": Queen, "R": Rook, "B": Bishop, "N": Knight}
+
+_SAN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?(x)?([a-h])([1-8])(?:=?([NBRQ]))?$")
+_TAG = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+_MOVETEXT_NOISE = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\d+\.(?:\.\.)?")
+
+
+def square_of(name):
+    """(row, col) of a square name such as "e4"; rank 8 is row 0."""
+    return 8 - int(name[1]), ord(name[0]) - ord("a")
+
+
+def parse_movetext(text):
+    """
+    Split PGN movetext into SAN moves, dropping move numbers, comments, NAGs,
+    variations and the result.
+    """
+    text = _MOVETEXT_NOISE.sub(" ", text)
+    # Remove (possibly nested) variations
+    depth, kept = 0, []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            kept.append(char)
+    moves = []
+    for token in "".join(kept).split():
+        token = token.rstrip("+#!?")
+        if token and token not in RESULTS:
+            moves.append(token)
+    return moves
+
+
+def _iter_games(lines):
+    """Group (offset, line) pairs into (start offset, headers, movetext) games."""
+    headers, movetext, start = {}, [], None
+    for offset, line in lines:
+        stripped = line.strip()
+        if stripped.startswith("["):
+            if movetext:
+                yield start, headers, " ".join(movetext)
+                headers, movetext, start = {}, [], None
+            match = _TAG.match(stripped)
+            if match:
+                if start is None:
+                    start = offset
+                headers[match.group(1)] = match.group(2)
+        elif stripped and not stripped.startswith("%"):
+            if start is None:
+                start = offset
+            movetext.append(stripped)
+    if movetext or headers:
+        yield start, headers, " ".join(movetext)
+
+
+def _read_lines(f, start=0):
+    offset = start
+    for raw in iter(f.readline, b""):
+        yield offset, raw.decode("utf-8", errors="replace")
+        offset += len(raw)
+
+
+def read_games(path):
+    """
+    Stream the games of a PGN file.
+
+    :return: A generator of (headers dict, list of SAN moves).
+    """
+    with open(path, "rb") as f:
+        for _, headers, movetext in _iter_games(_read_lines(f)):
+            yield headers, parse_movetext(movetext)
+
+
+def _attacked(board, square, by_white, occupied, captured=None):
+    """
+    Whether a square is attacked by one side under the ordinary rules of chess.
+
+    :param square: Square index row * 8 + col.
+    :param occupied: Occupancy bitboard of the (hypothetical) position.
+    :param captured: Square index of a piece of the attacking side that has been captured, or None.
+    """
+    pawn_attacks = bitboard.WHITE_PAWN_ATTACKS if by_white else bitboard.BLACK_PAWN_ATTACKS
+    for (row, col), piece in board.pieces["white" if by_white else "black"].items():
+        origin = row * 8 + col
+        if origin == captured:
+            continue
+        kind = bitboard.PIECE_INDEX[piece.symbol] % 6
+        if kind == bitboard.PAWN:
+            attacks = pawn_attacks[origin]
+        elif kind == bitboard.KNIGHT:
+            attacks = bitboard.KNIGHT_ATTACKS[origin]
+        elif kind == bitboard.KING:
+            attacks = bitboard.KING_ATTACKS[origin]
+        elif kind == bitboard.BISHOP:
+            attacks = bitboard.bishop_attacks(origin, occupied)
+        elif kind == bitboard.ROOK:
+            attacks = bitboard.rook_attacks(origin, occupied)
+        else:
+            attacks = bitboard.rook_attacks(origin, occupied) | bitboard.bishop_attacks(origin, occupied)
+        if attacks >> square & 1:
+            return True
+    return False
+
+
+def _leaves_king_in_check(board, start, end, white):
+    """Whether moving the piece on `start` to `end` exposes the mover's king."""
+    king = board.king_squares["white" if white else "black"]
+    if king is None:
+        return False
+    start_square, end_square = start[0] * 8 + start[1], end[0] * 8 + end[1]
+    occupied = ((board.white_bb | board.black_bb) & ~(1 << start_square)) | (1 << end_square)
+    king_square = end_square if king == start else king[0] * 8 + king[1]
+    return _attacked(board, king_square, not white, occupied, captured=end_square)
+
+
+def san_to_move(board, san):
+    """
+    Resolve a SAN move under the ordinary rules of chess.
+
+    :param board: Position before the move; board.white_turn is the side to move.
+    :param san: Move such as "e4", "Nbd7", "exd6", "O-O" or "e8=Q" (check marks are allowed).
+    :return: A tuple (start, end, promotion class or None).
+    :raises ValueError: If the move is malformed, impossible or ambiguous.
+    """
+    white = board.white_turn
+    color = "white" if white else "black"
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        row = 7 if white else 0
+        return (row, 4), (row, 6 if san in ("O-O", "0-0") else 2), None
+
+    match = _SAN.match(san)
+    if not match:
+        raise ValueError(f"Malformed SAN move: {san}")
+    letter, from_file, from_rank, capture, to_file, to_rank, promotion = match.groups()
+    end = square_of(to_file + to_rank)
+    end_square = end[0] * 8 + end[1]
+    occupied = board.white_bb | board.black_bb
+    symbol = letter or "P"
+    if not white:
+        symbol = symbol.lower()
+
+    candidates = []
+    for start, piece in board.pieces[color].items():
+        if piece.symbol != symbol:
+            continue
+        if from_file and start[1] != ord(from_file) - ord("a"):
+            continue
+        if from_rank and start[0] != 8 - int(from_rank):
+            continue
+        square = start[0] * 8 + start[1]
+        if symbol in "Pp":
+            step = -1 if white else 1
+            if capture:
+                reachable = end[0] - start[0] == step and abs(end[1] - start[1]) == 1
+            else:
+                double_row = 6 if white else 1
+                reachable = start[1] == end[1] and board.board[end[0]][end[1]] is None and (
+                    end[0] - start[0] == step or (start[0] == double_row and end[0] - start[0] == 2 * step
+                                                  and board.board[start[0] + step][start[1]] is None))
+        elif symbol in "Nn":
+            reachable = bitboard.KNIGHT_ATTACKS[square] >> end_square & 1
+        elif symbol in "Kk":
+            reachable = bitboard.KING_ATTACKS[square] >> end_square & 1
+        else:
+            attacks = 0
+            if symbol in "RrQq":
+                attacks |= bitboard.rook_attacks(square, occupied)
+            if symbol in "BbQq":
+                attacks |= bitboard.bishop_attacks(square, occupied)
+            reachable = attacks >> end_square & 1
+        if reachable:
+            candidates.append(start)
+
+    if len(candidates) > 1:
+        # SAN leaves out the disambiguation when the other piece is pinned
+        candidates = [start for start in candidates if not _leaves_king_in_check(board, start, end, white)]
+    if len(candidates) != 1:
+        raise ValueError(f"{'Ambiguous' if candidates else 'Impossible'} SAN move {san} in {board.to_fen()}")
+    return candidates[0], end, PROMOTIONS.get(promotion)
+
+
+def play_move(board, start, end, promotion=None, en_passant=None):
+    """
+    Make a move under the ordinary rules of chess: castling also moves the rook,
+    promotion replaces the pawn and en passant removes the captured pawn.
+
+    The extra square changes bypass move_history, so undo_move cannot revert such moves.
+
+    :return: The en passant square for the next move, or None.
+    """
+    piece = board.board[start[0]][start[1]]
+    target = board.board[end[0]][end[1]]
+    board.apply_move(start, end)
+    if isinstance(piece, King) and abs(end[1] - start[1]) == 2:
+        rook_from, rook_to = (end[0], 7 if end[1] == 6 else 0), (end[0], 5 if end[1] == 6 else 3)
+        rook = board.board[rook_from[0]][rook_from[1]]
+        board._place(rook_from[0], rook_from[1], None)
+        board._place(rook_to[0], rook_to[1], rook)
+    elif isinstance(piece, Pawn):
+        if promotion is not None:
+            board._place(end[0], end[1], promotion(piece.color))
+        elif target is None and start[1] != end[1] and end == en_passant:
+            board._place(start[0], end[1], None)
+        if abs(end[0] - start[0]) == 2:
+            return (start[0] + end[0]) // 2, start[1]
+    return None
+
+
+def game_records(headers, moves, game_id=0):
+    """
+    Replay one game and build its training records.
+
+    Replay stops at the first move that cannot be resolved; the records before it are kept.
+
+    :param headers: PGN tags; FEN (with SetUp) gives the start position and Result the outcome.
+    :param moves: SAN moves, see parse_movetext.
+    :return: A RECORD_DTYPE array with one record per position before a move.
+    """
+    board = Board.from_fen(headers["FEN"]) if "FEN" in headers else Board()
+    records = np.zeros(len(moves), dtype=RECORD_DTYPE)
+    en_passant = None
+    count = 0
+    for san in moves:
+        if board.is_game_over():
+            break
+        try:
+            start, end, promotion = san_to_move(board, san)
+        except ValueError:
+            break
+        record = records[count]
+        record['codes'] = board_to_codes(board)
+        record['move'] = (start[0] * 8 + start[1]) * 64 + end[0] * 8 + end[1]
+        record['ply'] = count
+        record['white_turn'] = board.white_turn
+        record['hash'] = board.hash
+        en_passant = play_move(board, start, end, promotion, en_passant)
+        count += 1
+    records = records[:count]
+    records['game'] = game_id
+    records['result'] = RESULTS.get(headers.get("Result", "*"), 0)
+    return records
+
+
+def _convert_range(task):
+    """Convert the games starting in bytes [start, end) of a file; returns (records, games)."""
+    path, start, end = task
+    results = []
+    games = 0
+    with open(path, "rb") as f:
+        if start:
+            # Begin at the first line starting at or after `start`
+            f.seek(start - 1)
+            start += len(f.readline()) - 1
+        lines = _read_lines(f, start)
+        synced = start == 0
+        for offset, headers, movetext in _iter_games(_game_lines(lines, end, synced)):
+            records = game_records(headers, parse_movetext(movetext), games)
+            results.append(records)
+            games += 1
+    records = np.concatenate(results) if results else np.zeros(0, dtype=RECORD_DTYPE)
+    return records, games
+
+
+def _game_lines(lines, end, synced):
+    """Lines of the games whose [Event tag starts before `end`, skipping a partial game at the start."""
+    for offset, line in lines:
+        if line.startswith("[Event "):
+            if offset >= end:
+                return
+            synced = True
+        if synced:
+            yield offset, line
+
+
+def convert_pgn(path, shard_dir, workers=constants.SELF_PLAY_WORKERS, chunk_size=16 * 1024 * 1024,
+                shard_size=1000000, append=False):
+    """
+    Convert a PGN file into training shards, in parallel over byte ranges of the file.
+
+    :param path: PGN file.
+    :param shard_dir: Output shard directory (see shards.py); shards already in it are deleted.
+    :param workers: Worker processes, None for one per CPU core; with 1 everything runs in this process.
+    :param chunk_size: Bytes of PGN per task.
+    :param shard_size: Records per shard file.
+    :param append: Keep the shards already in shard_dir and add the games after them.
+    :return: A dict with the number of 'games' and 'positions' written.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    size = os.path.getsize(path)
+    tasks = [(path, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+    games = positions = 0
+    start_time = time.perf_counter()
+
+    with ShardWriter(shard_dir, shard_size, append=append) as writer:
+        def collect(result):
+            nonlocal games, positions
+            records, count = result
+            records['game'] += games  # Number games across the whole file
+            writer.write(records)
+            games += count
+            positions += len(records)
+
+        if workers == 1:
+            for task in tasks:
+                collect(_convert_range(task))
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                for result in pool.imap(_convert_range, tasks):
+                    collect(result)
+
+    seconds = time.perf_counter() - start_time
+    print(f"Converted {games} games into {positions} positions in {seconds:.1f}s "
+          f"({positions / seconds if seconds > 0 else 0:.0f} positions/s).")
+    return {'games': games, 'positions': positions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a PGN file into training shards.")
+    parser.add_argument("pgn", help="PGN file.")
+    parser.add_argument("--out", default="pgn_data", help="Shard directory (default: pgn_data).")
+    parser.add_argument("--workers", type=int, default=constants.SELF_PLAY_WORKERS,
+                        help="Worker processes (default: one per CPU core).")
+    parser.add_argument("--chunk-mb", type=float, default=16, help="MB of PGN per task (default: 16).")
+    parser.add_argument("--shard-size", type=int, default=1000000, help="Records per shard file.")
+    parser.add_argument("--append", action="store_true", help="Add to the shards already in --out.")
+    args = parser.parse_args(argv)
+    convert_pgn(args.pgn, args.out, workers=args.workers, chunk_size=int(args.chunk_mb * 1024 * 1024),
+                shard_size=args.shard_size, append=args.append)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,40 @@
 # piece.py
 class Piece:
-    def __init__(self, color):
-        self.color = color
-        self.symbol = " "  # Placeholder, will be set by subclasses
-        self.point = 0
+    """
+    Pieces are immutable flyweights: Pawn("white") always returns the same
+    instance, so squares share pieces instead of each holding its own object,
+    and copying a board never clones a piece.
+    """
+    __slots__ = ("color", "symbol", "point")
+    symbols = (" ", " ")  # (white, black) symbol, set by subclasses
+    value = 0  # Point value, set by subclasses
+    _instances = {}  # (class, color) -> the shared instance
+
+    def __new__(cls, color):
+        instance = Piece._instances.get((cls, color))
+        if instance is None:
+            instance = super().__new__(cls)
+            object.__setattr__(instance, "color", color)
+            object.__setattr__(instance, "symbol", cls.symbols[0] if color == "white" else cls.symbols[1])
+            object.__setattr__(instance, "point", cls.value)
+            Piece._instances[(cls, color)] = instance
+        return instance
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} pieces are shared and cannot be modified")
+
+    def __reduce__(self):
+        # Pickling and deepcopy resolve to the shared instance
+        return type(self), (self.color,)
 
     def move(self, board, start, end):
         # Basic move validation to be overridden by specific piece classes
         raise NotImplementedError("This method must be overridden in the subclass.")
 
 class Pawn(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.symbol = 'P' if color == "white" else 'p'
-        self.point = 1
+    __slots__ = ()
+    symbols = ('P', 'p')
+    value = 1
 
     def __str__(self) -> str:
         return super().__str__()
@@ -41,10 +62,9 @@ class Pawn(Piece):
           return False  # If none of the above conditions are met, the move is invalid
 
 class Rook(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.symbol = 'R' if color == "white" else 'r'
-        self.point = 5
+    __slots__ = ()
+    symbols = ('R', 'r')
+    value = 5
 
     def move(self, board, start, end):
         start_row, start_col = start
@@ -75,10 +95,9 @@ class Rook(Piece):
         return False
 
 class Knight(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.symbol = 'N' if color == "white" else 'n'
-        self.point = 3
+    __slots__ = ()
+    symbols = ('N', 'n')
+    value = 3
 
     def move(self, board, start, end):
         start_row, start_col = start
@@ -89,10 +108,9 @@ class Knight(Piece):
         return False
 
 class Bishop(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.symbol = 'B' if color == "white" else 'b'
-        self.point = 3
+    __slots__ = ()
+    symbols = ('B', 'b')
+    value = 3
 
     def move(self, board, start, end):
         start_row, start_col = start
@@ -134,24 +152,23 @@ class Bishop(Piece):
         return False
 
 class Queen(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.symbol = 'Q' if color == "white" else 'q'
-        self.point = 10
+    __slots__ = ()
+    symbols = ('Q', 'q')
+    value = 10
 
     def move(self, board, start, end):
         start_row, start_col = start
         end_row, end_col = end
         # Combines the power of Rook and Bishop
-        if Rook(self.color).move(board, start, end) or Bishop(self.color).move(board, start, end) and board.get_piece(end_row, end_col) is not None and board.get_piece(end_row, end_col).color != self.color:
+        # (the Rook and Bishop rules only look at the board, so no pieces are created for them)
+        if Rook.move(self, board, start, end) or Bishop.move(self, board, start, end) and board.get_piece(end_row, end_col) is not None and board.get_piece(end_row, end_col).color != self.color:
             return True
         return False
 
 class King(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.symbol = 'K' if color == "white" else 'k'
-        self.point = 0
+    __slots__ = ()
+    symbols = ('K', 'k')
+    value = 0
 
     def move(self, board, start, end):
       start_row, start_col = start
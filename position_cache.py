@@ -0,0 +1,52 @@
+# position_cache.py
+from collections import OrderedDict
+
+
+class PositionCache:
+    """
+    Bounded LRU cache of per-position work, keyed by Zobrist hash.
+
+    Each entry is a dict holding whatever was computed for the position, e.g.
+    'moves' (legal move list), 'state' (encoded board tensor) and 'output'
+    (model output). Entries must be treated as read-only by callers.
+    """
+    def __init__(self, capacity=100000):
+        """
+        :param capacity: Maximum number of positions kept; the least recently used is evicted first.
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """Return the entry for `key` and mark it as recently used, or None."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """Store an entry, evicting the least recently used one if the cache is full."""
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,67 @@
+# render.py
+"""
+Optional pygame drawing layer.
+
+Nothing else imports pygame: game.py and ChessEnv.draw import this module
+when they first need a window, so headless code (self-play, training,
+search, tools) never loads pygame or opens a window.
+"""
+import pygame
+
+from constants import WIDTH, HEIGHT, ROWS, COLS, SQUARE_SIZE, WHITE, BLACK, LIGHT_BROWN, DARK_BROWN
+
+
+class BoardRenderer:
+    """A window showing a Board; only squares that changed since the last draw are repainted."""
+    def __init__(self, caption="Chess"):
+        pygame.init()
+        self.win = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption(caption)
+        self.font = pygame.font.SysFont('Arial', 48)
+        self.glyphs = {}  # Piece symbol -> rendered surface
+        self.invalidate()
+
+    def invalidate(self):
+        """Repaint every square on the next draw."""
+        self.drawn = [[""] * COLS for _ in range(ROWS)]  # "" matches no square
+
+    def glyph(self, piece):
+        """Rendered surface for a piece symbol, rendered once and cached."""
+        surface = self.glyphs.get(piece.symbol)
+        if surface is None:
+            surface = self.font.render(piece.symbol, True, WHITE if piece.color == "white" else BLACK)
+            self.glyphs[piece.symbol] = surface
+        return surface
+
+    def draw(self, board):
+        """
+        Repaint the squares whose piece changed and push them to the display.
+
+        :return: The list of repainted rects.
+        """
+        dirty = []
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = board.get_piece(row, col)
+                symbol = piece.symbol if piece else None
+                if self.drawn[row][col] == symbol:
+                    continue
+                self.drawn[row][col] = symbol
+                rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+                pygame.draw.rect(self.win, LIGHT_BROWN if (row + col) % 2 == 0 else DARK_BROWN, rect)
+                if piece:
+                    self.win.blit(self.glyph(piece),
+                                  (col * SQUARE_SIZE + SQUARE_SIZE // 4, row * SQUARE_SIZE + SQUARE_SIZE // 4))
+                dirty.append(rect)
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+    @staticmethod
+    def square_at(pos):
+        """(row, col) of the square under a pixel position."""
+        x, y = pos
+        return y // SQUARE_SIZE, x // SQUARE_SIZE
+
+    def close(self):
+        pygame.quit()
@@ -0,0 +1,233 @@
+# replay.py
+"""
+Replay buffer and a pipelined self-play/training loop.
+
+Self-play producer processes push finished games into a bounded queue; a
+collector thread in the trainer moves them into a ReplayBuffer, from which
+the trainer samples minibatches while the producers keep playing. Every
+`publish_interval` steps the trainer copies its weights into a shared-memory
+model that the producers reload from, so generation and training run at the
+same time within a fixed amount of memory.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+
+import constants
+from encoder import encode_boards
+from inference import LocalInference
+from model import ChessModel
+from position_cache import PositionCache
+from selfplay import play_game
+from shards import RECORD_DTYPE
+
+
+class ReplayBuffer:
+    """
+    Bounded FIFO of position records with per-record sampling weights.
+
+    The oldest records are evicted once `capacity` is reached, or once they are
+    older than `max_age` seconds. All methods are thread-safe.
+    """
+    def __init__(self, capacity, max_age=None):
+        """
+        :param capacity: Maximum number of records kept.
+        :param max_age: Optional maximum record age in seconds.
+        """
+        self.capacity = capacity
+        self.max_age = max_age
+        self.records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.weights = np.zeros(capacity, dtype=np.float64)
+        self.added_at = np.zeros(capacity, dtype=np.float64)
+        self.start = 0  # Slot of the oldest record
+        self.size = 0
+        self.total_added = 0
+        self._lock = threading.Condition()  # Notified when records are added
+
+    def __len__(self):
+        return self.size
+
+    def add(self, records, weights=None):
+        """
+        Append records, evicting the oldest ones if the buffer is full.
+
+        :param records: A RECORD_DTYPE array (see shards.py).
+        :param weights: Optional sampling weight per record, default 1.
+        """
+        count = len(records)
+        if count == 0:
+            return
+        if weights is None:
+            weights = np.ones(count)
+        if count > self.capacity:
+            records, weights = records[-self.capacity:], weights[-self.capacity:]
+            count = self.capacity
+
+        with self._lock:
+            now = time.monotonic()
+            slots = (self.start + self.size + np.arange(count)) % self.capacity
+            self.records[slots] = records
+            self.weights[slots] = weights
+            self.added_at[slots] = now
+            overflow = max(0, self.size + count - self.capacity)
+            self.start = (self.start + overflow) % self.capacity
+            self.size = min(self.capacity, self.size + count)
+            self.total_added += count
+            self._evict_expired(now)
+            self._lock.notify_all()
+
+    def sample(self, batch_size, rng=np.random, timeout=None):
+        """
+        Draw a weighted random minibatch (with replacement).
+
+        If every record has expired (see max_age), waits for new ones to be added.
+
+        :param timeout: Maximum seconds to wait for records, None to wait as long as it takes.
+        :return: A RECORD_DTYPE array of length batch_size.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._evict_expired(now)
+                if self.size:
+                    break
+                if deadline is not None and now >= deadline:
+                    raise ValueError("Cannot sample from an empty replay buffer")
+                self._lock.wait(None if deadline is None else deadline - now)
+            slots = (self.start + np.arange(self.size)) % self.capacity
+            weights = self.weights[slots]
+            chosen = rng.choice(slots, size=batch_size, p=weights / weights.sum())
+            return self.records[chosen]
+
+    def _evict_expired(self, now):
+        if self.max_age is None:
+            return
+        while self.size and now - self.added_at[self.start] > self.max_age:
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+
+
+def _produce(shared_model, version, lock, games_queue, stop, seed, cache_size):
+    """Self-play producer process: plays games with the latest published weights."""
+    torch.set_num_threads(1)
+    torch.manual_seed(seed)
+    model = ChessModel()
+    evaluator = LocalInference(model)
+    position_cache = PositionCache(cache_size)
+    local_version = -1
+    game_id = 0
+
+    while not stop.is_set():
+        if version.value != local_version:
+            with lock:
+                model.load_state_dict(shared_model.state_dict())
+                local_version = version.value
+            position_cache.clear()  # Cached outputs belong to the old weights
+
+        records = play_game(evaluator, position_cache, game_id=seed * 1000000 + game_id)
+        game_id += 1
+        while not stop.is_set():
+            try:
+                games_queue.put(records, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+def run_pipeline(model, steps, workers=constants.SELF_PLAY_WORKERS, batch_size=256, learning_rate=0.001,
+                 capacity=500000, max_age=None, min_buffer=10000, publish_interval=100,
+                 queue_size=64, cache_size=100000, seed=0, log_interval=100):
+    """
+    Train `model` on self-play data generated concurrently by worker processes.
+
+    :param model: The ChessModel to train; producers start from its current weights.
+    :param steps: Number of optimizer steps to run.
+    :param workers: Number of producer processes, None for one per CPU core.
+    :param batch_size: Minibatch size.
+    :param learning_rate: Adam learning rate.
+    :param capacity: Replay buffer capacity in positions.
+    :param max_age: Optional replay buffer record lifetime in seconds.
+    :param min_buffer: Positions to collect before training starts.
+    :param publish_interval: Optimizer steps between publishing weights to the producers.
+    :param queue_size: Finished games that may wait between producers and trainer.
+    :param cache_size: Size of each producer's PositionCache.
+    :param seed: Producer i is seeded with seed + i.
+    :param log_interval: Optimizer steps between progress lines.
+    :return: The ReplayBuffer at the end of the run.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    shared_model = ChessModel()
+    shared_model.load_state_dict(model.state_dict())
+    shared_model.share_memory()
+    version = multiprocessing.Value("i", 0)
+    lock = multiprocessing.Lock()
+    games_queue = multiprocessing.Queue(queue_size)
+    stop = multiprocessing.Event()
+
+    producers = [multiprocessing.Process(target=_produce, name=f"self-play-{i}", daemon=True,
+                                         args=(shared_model, version, lock, games_queue, stop, seed + i, cache_size))
+                 for i in range(workers)]
+    for producer in producers:
+        producer.start()
+
+    buffer = ReplayBuffer(capacity, max_age)
+
+    def collect():
+        while not stop.is_set():
+            try:
+                buffer.add(games_queue.get(timeout=0.1))
+            except queue.Empty:
+                pass
+
+    collector = threading.Thread(target=collect, name="replay-collector", daemon=True)
+    collector.start()
+
+    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+    states = torch.zeros((batch_size, 12, 8, 8), dtype=torch.float32)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    total_loss = 0.0
+    try:
+        step = 0
+        while step < steps:
+            if len(buffer) < min_buffer:
+                time.sleep(0.05)
+                continue
+
+            records = buffer.sample(batch_size, rng)
+            encode_boards(np.ascontiguousarray(records['codes']), out=states)
+            moves = torch.from_numpy(records['move'].astype(np.int64))
+
+            model.train()
+            optimizer.zero_grad()
+            loss = F.cross_entropy(model(states), moves)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item()
+            step += 1
+
+            if step % publish_interval == 0:
+                with lock:
+                    shared_model.load_state_dict(model.state_dict())
+                    version.value += 1
+            if step % log_interval == 0:
+                seconds = time.perf_counter() - start
+                print(f"Step {step}/{steps}, loss {total_loss / log_interval:.4f}, buffer {len(buffer)}, "
+                      f"{buffer.total_added / seconds:.0f} positions/s generated, weights v{version.value}")
+                total_loss = 0.0
+    finally:
+        stop.set()
+        collector.join()
+        for producer in producers:
+            producer.join(timeout=5)
+            if producer.is_alive():
+                producer.terminate()
+
+    return buffer
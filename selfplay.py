@@ -0,0 +1,278 @@
+# selfplay.py
+"""
+Headless self-play: no pygame, no per-move printing and no sleeps.
+
+Games are split into tasks and spread over a process pool. Every task gets
+its own seed derived from the run seed, so the merged dataset does not
+depend on how tasks were scheduled onto workers. Workers either run their
+own copy of the model or send positions to a shared InferenceServer in the
+parent process, which batches them (see inference.py).
+"""
+import multiprocessing
+import random
+import time
+
+import numpy as np
+import torch
+
+import constants
+from board import Board
+from book import load_book
+from encoder import board_to_codes, encode_boards, move_to_index, select_legal_move
+from eval_cache import EvalCache
+from inference import InferenceServer, LocalInference
+from mcts import MCTS
+from model import ChessModel
+from position_cache import PositionCache
+from shards import RECORD_DTYPE, ShardWriter
+
+# Per-process state, set up once by _init_worker
+_worker_evaluator = None
+_worker_cache = None
+
+
+def play_game(evaluator, position_cache=None, max_plies=constants.MAX_GAME_PLIES, game_id=0,
+              mcts_nodes=constants.MCTS_NODES, book=None, rng=None):
+    """
+    Play one game of the model against itself.
+
+    :param evaluator: Evaluator for the model choosing moves for both sides (see inference.py).
+    :param position_cache: Optional PositionCache shared between games.
+    :param max_plies: Stop the game after this many plies.
+    :param game_id: Stored in the 'game' field of the records.
+    :param mcts_nodes: MCTS simulations per move (see mcts.py); 0 plays the policy's choice directly.
+    :param book: Optional OpeningBook (see book.py); within its first constants.BOOK_PLIES plies the
+                 game follows the book without running the model while the position is in it.
+    :param rng: random.Random picking book moves in proportion to how often they were played, so games
+                start from varied positions; None plays the book's best move.
+    :return: A RECORD_DTYPE array (see shards.py) with one record per move played: the position's
+             piece codes and hash, the chosen move's index (see encoder.move_to_index) and the result.
+    """
+    board = Board()
+    codes, moves, turns, hashes = [], [], [], []
+    engine = MCTS(evaluator) if mcts_nodes else None
+
+    in_book = book is not None
+    while not board.is_game_over() and len(moves) < max_plies:
+        color = "white" if board.white_turn else "black"
+
+        if in_book:
+            move = book.choose(board, rng) if len(moves) < constants.BOOK_PLIES else None
+            in_book = move is not None
+            if in_book:
+                codes.append(board_to_codes(board))
+                moves.append(move_to_index(move))
+                turns.append(board.white_turn)
+                hashes.append(board.hash)
+                board.apply_move(*move)
+                continue
+
+        if engine is not None:
+            # The search tree is carried over from move to move
+            move = engine.search(board, nodes=mcts_nodes)
+            if move is None:
+                break
+            codes.append(board_to_codes(board))
+            moves.append(move_to_index(move))
+            turns.append(board.white_turn)
+            hashes.append(board.hash)
+            board.apply_move(*move)
+            continue
+
+        entry = position_cache.get(board.hash) if position_cache is not None else None
+        if entry is None:
+            position_codes = board_to_codes(board)
+            output = evaluator.evaluate(position_codes).unsqueeze(0)
+            entry = {'moves': board.get_all_legal_moves(color), 'codes': position_codes, 'output': output}
+            if position_cache is not None:
+                position_cache.put(board.hash, entry)
+
+        # Skip moves that lead back to a position already reached in this game
+        candidates = [move for move in entry['moves'] if not board.repetition_count(board.hash_after(*move))]
+        if not candidates:
+            break
+
+        move = candidates[select_legal_move(entry['output'], candidates)]
+        codes.append(entry['codes'])
+        moves.append(move_to_index(move))
+        turns.append(board.white_turn)
+        hashes.append(board.hash)
+        board.apply_move(*move)
+
+    records = np.zeros(len(moves), dtype=RECORD_DTYPE)
+    if moves:
+        records['codes'] = np.stack(codes)
+        records['move'] = moves
+        records['white_turn'] = turns
+        records['hash'] = hashes
+    records['game'] = game_id
+    records['ply'] = np.arange(len(moves))
+    if board.king_squares["black"] is None:
+        records['result'] = 1
+    elif board.king_squares["white"] is None:
+        records['result'] = -1
+    return records
+
+
+def play_games(evaluator, games, seed=0, position_cache=None, first_game=0, mcts_nodes=constants.MCTS_NODES,
+               book=None):
+    """
+    Play several games in the current process.
+
+    :param book: Optional OpeningBook or path of one, see play_game.
+    :return: A RECORD_DTYPE array with the records of all games.
+    """
+    torch.manual_seed(seed)
+    rng = random.Random(seed)
+    if isinstance(book, str):
+        book = load_book(book)
+    records = [play_game(evaluator, position_cache, game_id=first_game + i, mcts_nodes=mcts_nodes, book=book,
+                         rng=rng)
+               for i in range(games)]
+    return np.concatenate(records) if records else np.zeros(0, dtype=RECORD_DTYPE)
+
+
+def _init_worker(state_dict, cache_size, clients=None, next_client=None, eval_cache=None):
+    global _worker_evaluator, _worker_cache
+    # One intra-op thread per worker, the pool provides the parallelism
+    torch.set_num_threads(1)
+    if clients is not None:
+        with next_client.get_lock():
+            _worker_evaluator = clients[next_client.value]
+            next_client.value += 1
+    else:
+        model = ChessModel()
+        model.load_state_dict(state_dict)
+        _worker_evaluator = LocalInference(model, eval_cache)
+    _worker_cache = PositionCache(cache_size)
+
+
+def _play_task(task):
+    games, seed, first_game, mcts_nodes, book = task
+    return play_games(_worker_evaluator, games, seed, _worker_cache, first_game, mcts_nodes, book)
+
+
+def generate_self_play_data(model, games, workers=constants.SELF_PLAY_WORKERS, seed=0,
+                            cache_size=100000, games_per_task=None, batch_inference=False,
+                            max_batch=64, max_wait=0.002, shard_dir=None, shard_size=1000000,
+                            mcts_nodes=constants.MCTS_NODES, resume=None, on_progress=None,
+                            eval_cache_size=constants.EVAL_CACHE_SIZE, book=constants.OPENING_BOOK,
+                            append=False):
+    """
+    Generate self-play data headlessly, spreading games over a process pool.
+
+    :param model: The ChessModel choosing moves; its weights are copied to every worker.
+    :param games: Total number of games to play.
+    :param workers: Number of worker processes, None for one per CPU core. With 1 the games
+                    are played in the current process.
+    :param seed: Run seed; task i is seeded with seed + i.
+    :param cache_size: Size of each worker's PositionCache.
+    :param games_per_task: Games per pool task; smaller tasks balance load better.
+    :param batch_inference: Evaluate positions from all workers on one InferenceServer in this
+                            process instead of giving every worker its own model.
+    :param max_batch: InferenceServer batch size limit.
+    :param max_wait: InferenceServer batching deadline in seconds.
+    :param shard_dir: If given, positions are streamed into shards in this directory as tasks finish
+                      (see shards.py) instead of being kept in memory. Shards already in it are deleted
+                      unless `append` is set or the run resumes.
+    :param shard_size: Records per shard file.
+    :param mcts_nodes: MCTS simulations per move; 0 plays the policy's choice without search.
+    :param resume: A progress dict from on_progress (e.g. from a checkpoint) to continue from: its finished
+                   tasks are skipped and the shards are cut back to its cursor. Needs shard_dir and the
+                   same games and seed as the interrupted run.
+    :param book: Path of an opening book the games start from (see book.py), or None.
+    :param eval_cache_size: Entries of an EvalCache of model outputs shared by all workers, 0 for none.
+    :param append: Add the positions to the shards already in shard_dir.
+    :param on_progress: With shard_dir, called before the first task and after every finished task with a
+                        progress dict: 'tasks_done', 'games_done', 'positions', 'games_per_task' and the
+                        shard 'cursor'.
+    :return: A dict with 'states', a float32 array of shape (N, 12, 8, 8), and 'moves', an int64 array
+             of shape (N,); with shard_dir, a dict with the number of 'positions' written and the 'shard_dir'.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    if games_per_task is None and resume is not None:
+        games_per_task = resume['games_per_task']  # The same task split as the interrupted run
+    if games_per_task is None:
+        games_per_task = max(1, min(100, games // (workers * 4)))
+    tasks = []
+    for i, first_game in enumerate(range(0, games, games_per_task)):
+        tasks.append((min(games_per_task, games - first_game), seed + i, first_game, mcts_nodes, book))
+
+    if resume is not None and not shard_dir:
+        raise ValueError("Resuming self-play needs a shard_dir")
+    progress = dict(resume) if resume is not None else {'tasks_done': 0, 'games_done': 0, 'positions': 0,
+                                                        'games_per_task': games_per_task}
+    resumed_positions = progress['positions']
+    writer = ShardWriter(shard_dir, shard_size, cursor=progress.get('cursor'), append=append) \
+        if shard_dir else None
+    results = []
+
+    def report():
+        writer.flush()
+        progress['cursor'] = writer.cursor()
+        on_progress(dict(progress))
+
+    def collect(records):
+        if writer is not None:
+            writer.write(records)
+            # Tasks finish in order, so everything up to here is complete
+            progress['games_done'] += task_sizes[progress['tasks_done']]
+            progress['tasks_done'] += 1
+            progress['positions'] += len(records)
+            if on_progress is not None:
+                report()
+        else:
+            results.append(records)
+
+    task_sizes = [task[0] for task in tasks]
+    tasks = tasks[progress['tasks_done']:]
+    if writer is not None and on_progress is not None:
+        report()  # The starting point, so a crash before the first task can be resumed too
+
+    eval_cache = None
+    if eval_cache_size:
+        eval_cache = EvalCache(eval_cache_size, top_k=constants.EVAL_CACHE_TOP_K, shared=workers > 1)
+
+    start = time.perf_counter()
+    if workers == 1:
+        position_cache = PositionCache(cache_size)
+        evaluator = LocalInference(model, eval_cache)
+        for task_games, task_seed, first_game, _, _ in tasks:
+            collect(play_games(evaluator, task_games, task_seed, position_cache, first_game, mcts_nodes, book))
+    elif batch_inference:
+        server = InferenceServer(model, max_batch=max_batch, max_wait=max_wait, cache=eval_cache)
+        clients = server.create_clients(workers)
+        next_client = multiprocessing.Value("i", 0)
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(None, cache_size, clients, next_client)) as pool:
+            # Start the server threads only after the workers have been forked
+            with server:
+                for records in pool.imap(_play_task, tasks):
+                    collect(records)
+        stats = server.stats()
+        print(f"Inference server: {stats['batches']} batches, mean batch size {stats['mean_batch_size']:.1f}, "
+              f"mean latency {stats['mean_latency_ms']:.2f}ms.")
+    else:
+        state_dict = {name: tensor.detach().cpu() for name, tensor in model.state_dict().items()}
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(state_dict, cache_size, None, None, eval_cache)) as pool:
+            for records in pool.imap(_play_task, tasks):
+                collect(records)
+
+    positions = writer.records_written if writer is not None else sum(len(records) for records in results)
+    played = sum(task[0] for task in tasks)
+    seconds = time.perf_counter() - start
+    print(f"Generated {positions} positions over {played} games with {workers} workers "
+          f"in {seconds:.1f}s ({played / seconds:.1f} games/s, {positions / seconds:.0f} positions/s).")
+
+    if eval_cache is not None:
+        stats = eval_cache.stats()
+        print(f"Evaluation cache: {stats['hit_rate']:.1%} hit rate, {stats['evictions']} evictions.")
+        eval_cache.close()
+
+    if writer is not None:
+        writer.close()
+        return {'positions': resumed_positions + positions, 'shard_dir': shard_dir}
+    records = np.concatenate(results) if results else np.zeros(0, dtype=RECORD_DTYPE)
+    return {'states': encode_boards(np.ascontiguousarray(records['codes'])).numpy(),
+            'moves': records['move'].astype(np.int64)}
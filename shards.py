@@ -0,0 +1,188 @@
+# shards.py
+"""
+Append-only, memory-mappable on-disk format for training positions.
+
+A shard directory holds files named shard-00000.bin, shard-00001.bin, ...
+Each file is a flat array of fixed-size RECORD_DTYPE records (86 bytes per
+position instead of a 3 KB float32 plane stack) with no header, so a file
+can be memory-mapped directly and appended to at any time. A partially
+written record at the end of a file (e.g. after a crash) is ignored.
+"""
+import glob
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from encoder import encode_boards
+
+RECORD_DTYPE = np.dtype([
+    ('codes', 'i1', (8, 8)),  # Piece codes, see encoder.board_to_codes
+    ('move', '<i2'),          # Played move, see encoder.move_to_index
+    ('game', '<i8'),          # Game number within the run
+    ('ply', '<i2'),           # Ply number within the game
+    ('white_turn', 'i1'),     # 1 if white played the move
+    ('result', 'i1'),         # Game result: 1 white won, -1 black won, 0 otherwise
+    ('hash', '<u8'),          # Zobrist hash of the position
+])
+
+SHARD_PATTERN = "shard-*.bin"
+
+
+def shard_path(directory, index):
+    return os.path.join(directory, f"shard-{index:05d}.bin")
+
+
+def shard_files(directory):
+    """Sorted list of the shard files in a directory."""
+    return sorted(glob.glob(os.path.join(directory, SHARD_PATTERN)))
+
+
+def open_shard(path):
+    """Memory-map the complete records of one shard file (read-only)."""
+    count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+
+class ShardWriter:
+    """
+    Streams records into shard files, starting a new file every `shard_size` records.
+
+    Shards already in the directory are deleted unless writing appends to them (append=True)
+    or resumes at a cursor, so a dataset only holds the records of the runs meant to be in it.
+    """
+    def __init__(self, directory, shard_size=1000000, cursor=None, append=False):
+        """
+        :param directory: Shard directory, created if missing.
+        :param shard_size: Maximum number of records per shard file.
+        :param cursor: Resume writing at a position returned by cursor(), e.g. from a checkpoint;
+                       records written after it are discarded.
+        :param append: Keep the existing shards and write after the last one.
+        """
+        self.directory = directory
+        self.shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+
+        if cursor is None and not append:
+            for path in shard_files(directory):
+                os.remove(path)
+        elif cursor is not None:
+            shard_index, shard_count = cursor
+            for path in shard_files(directory)[shard_index + 1:]:
+                os.remove(path)
+            with open(shard_path(directory, shard_index), 'ab') as f:
+                if f.tell() < shard_count * RECORD_DTYPE.itemsize:
+                    raise ValueError(f"Shard {shard_index} in {directory} has fewer than {shard_count} records")
+                f.truncate(shard_count * RECORD_DTYPE.itemsize)
+
+        existing = shard_files(directory)
+        self.shard_index = len(existing) - 1 if existing else 0
+        self.shard_count = os.path.getsize(existing[-1]) // RECORD_DTYPE.itemsize if existing else 0
+        if existing:
+            # Drop a torn record left at the end of the last shard
+            with open(existing[-1], 'r+b') as f:
+                f.truncate(self.shard_count * RECORD_DTYPE.itemsize)
+        self.records_written = 0
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, records):
+        """
+        Append records to the shards.
+
+        :param records: A NumPy array with dtype RECORD_DTYPE.
+        """
+        records = np.ascontiguousarray(records, dtype=RECORD_DTYPE)
+        start = 0
+        while start < len(records):
+            if self.shard_count >= self.shard_size:
+                self._close_file()
+                self.shard_index += 1
+                self.shard_count = 0
+            if self._file is None:
+                self._file = open(shard_path(self.directory, self.shard_index), 'ab')
+            chunk = records[start:start + self.shard_size - self.shard_count]
+            self._file.write(chunk.tobytes())
+            self.shard_count += len(chunk)
+            self.records_written += len(chunk)
+            start += len(chunk)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def cursor(self):
+        """Current write position as (shard index, records in that shard)."""
+        return self.shard_index, self.shard_count
+
+    def close(self):
+        self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+class ShardDataset(Dataset):
+    """
+    ChessDataset variant that memory-maps a shard directory.
+
+    Only the records that are indexed are read from disk; planes are decoded
+    from the int8 piece codes on the fly, a whole batch at a time when used
+    through get_batch or a DataLoader (via __getitems__).
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.shards = [open_shard(path) for path in shard_files(directory)]
+        self.shards = [shard for shard in self.shards if len(shard)]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def records(self, indices):
+        """Gather the records at the given global indices into one array."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+        if (shard_ids == shard_ids[0]).all():
+            shard = shard_ids[0]
+            return self.shards[shard][indices - self.offsets[shard]]
+        out = np.empty(len(indices), dtype=RECORD_DTYPE)
+        for shard in np.unique(shard_ids):
+            selected = shard_ids == shard
+            out[selected] = self.shards[shard][indices[selected] - self.offsets[shard]]
+        return out
+
+    def get_batch(self, indices, out=None):
+        """
+        Decode a batch of positions.
+
+        :param indices: Global record indices.
+        :param out: Optional preallocated (N, 12, 8, 8) float tensor for the planes.
+        :return: A tuple (states, moves) of a float32 (N, 12, 8, 8) tensor and a long (N,) tensor.
+        """
+        records = self.records(indices)
+        states = encode_boards(np.ascontiguousarray(records['codes']), out=out)
+        return states, torch.from_numpy(records['move'].astype(np.int64))
+
+    def __getitem__(self, idx):
+        states, moves = self.get_batch([idx])
+        return states[0], moves[0]
+
+    def __getitems__(self, indices):
+        # Used by DataLoader to fetch a whole batch with one call
+        states, moves = self.get_batch(indices)
+        return list(zip(states, moves))
@@ -1,15 +1,21 @@
 import torch
 import torch.optim as optim
 import torch.nn.functional as F
-from torch.utils.data import DataLoader, Dataset
-import numpy as np
-from chess_env import *  # This is a placeholder; you need an actual environment
+from torch.utils.data import Dataset
+from chess_env import ChessEnv
 from model import ChessModel  # Ensure this matches your actual model definition
-from encoder import encode_board_state, decode_move, select_legal_move
-from board import Board
-import os
-import pygame
+from encoder import select_legal_move, move_to_index
+from position_cache import PositionCache
+import selfplay
+from replay import run_pipeline
+from shards import ShardDataset
+from training_data import InMemoryChessData, make_loader
+from checkpoint import Checkpointer, load_checkpoint, rng_state, set_rng_state, write_atomic
+import argparse
+import contextlib
+import time
 import constants
+import instrument
 
 class ChessDataset(Dataset):
     """Chess dataset for loading self-play data."""
@@ -23,19 +29,53 @@ class ChessDataset(Dataset):
     def __getitem__(self, idx):
         return self.states[idx], self.moves[idx]
 
-def train_model(model, epochs, learning_rate, self_play_data):
+def train_model(model, epochs, learning_rate, self_play_data, batch_size=64, num_workers=0,
+                augment=False, pin_memory=None, seed=0, resume=None, on_progress=None):
+    """
+    :param self_play_data: A dict with 'states' and 'moves', or a dataset with get_batch
+                           such as ShardDataset (streamed from disk).
+    :param batch_size: Minibatch size.
+    :param num_workers: DataLoader worker processes preparing batches ahead of training.
+    :param augment: Randomly apply the color flip + vertical mirror symmetry to samples.
+    :param pin_memory: Pin batches in memory, defaults to True when CUDA is available.
+    :param seed: Seed for shuffling and augmentation.
+    :param resume: A trainer position from on_progress (e.g. from a checkpoint) to continue from;
+                   `model` must hold the weights saved with it. Batch order and augmentation only
+                   depend on the seed, epoch and batch, so the run continues exactly.
+    :param on_progress: Called after every batch with the optimizer and the trainer position, a dict
+                        with 'epoch', 'batch' (batches done in the epoch), 'total_loss' and 'samples'.
+    """
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+    device = next(model.parameters()).device
+    position = {'epoch': 0, 'batch': 0, 'total_loss': 0.0, 'samples': 0}
+    if resume is not None:
+        optimizer.load_state_dict(resume['optimizer'])
+        position.update({key: resume[key] for key in position})
 
-    for epoch in range(epochs):
-        dataset = ChessDataset(self_play_data['states'], self_play_data['moves'])
-        dataloader = DataLoader(dataset, batch_size=64, shuffle=True)
+    # Build the source once: contiguous tensors for in-memory data, the dataset itself for shards
+    if isinstance(self_play_data, dict):
+        source = InMemoryChessData(self_play_data['states'], self_play_data['moves'])
+    else:
+        source = self_play_data
+    dataloader, batches = make_loader(source, batch_size=batch_size, num_workers=num_workers,
+                                      pin_memory=pin_memory, augment=augment, seed=seed)
 
+    for epoch in range(position['epoch'], epochs):
+        # A resumed epoch continues after its last finished batch
+        first_batch = position['batch'] if epoch == position['epoch'] else 0
+        batches.set_epoch(epoch, first_batch)
         model.train()
-        total_loss = 0
+        total_loss = position['total_loss'] if first_batch else 0
+        samples = position['samples'] if first_batch else 0
+        done = first_batch
+        data_time = 0.0
+        start = time.perf_counter()
+        fetch_start = start
 
         for states, moves in dataloader:
-            states = torch.tensor(states, dtype=torch.float)
-            moves = torch.tensor(moves, dtype=torch.long)
+            data_time += time.perf_counter() - fetch_start
+            states = states.to(device, non_blocking=True)
+            moves = moves.to(device, non_blocking=True)
 
             optimizer.zero_grad()
             outputs = model(states)
@@ -44,15 +84,30 @@ def train_model(model, epochs, learning_rate, self_play_data):
             optimizer.step()
 
             total_loss += loss.item()
+            samples += len(moves)
+            done += 1
+            if on_progress is not None:
+                on_progress(optimizer, {'epoch': epoch, 'batch': done, 'total_loss': total_loss, 'samples': samples})
+            fetch_start = time.perf_counter()
 
-        print(f'Epoch {epoch+1}, Loss: {total_loss/len(dataloader)}')
+        seconds = time.perf_counter() - start
+        print(f'Epoch {epoch+1}, Loss: {total_loss/max(1, done)}, '
+              f'{samples / seconds:.0f} samples/s, {data_time / seconds:.0%} of time waiting for data')
 
-def generate_self_play_data(model, games):
+def generate_self_play_data(model, games, cache_size=100000):
+    """
+    Play games of the model against itself and record (state, move) pairs.
+
+    :param model: The ChessModel choosing moves for both sides.
+    :param games: Number of games to play.
+    :param cache_size: Number of positions whose legal moves, encoded state and model
+                       output are kept in an LRU cache shared by all games.
+    """
     data = {'states': [], 'moves': []}
+    position_cache = PositionCache(cache_size)
     # print("Chess environment creating...")
     env = ChessEnv()  # Ensure ChessEnv is properly defined and integrated with your model
     # print("Chess environment created!")
-    clock = pygame.time.Clock()
 
     total_moves = 0  # Track the total number of moves for all games
 
@@ -61,32 +116,36 @@ def generate_self_play_data(model, games):
       env.reset()
       game_moves = 0  # Track the number of moves for the current game
       turn = "white"
-      recent_moves = []
 
       while not env.is_game_over():
         turn = "white" if turn == "black" else "black"
 
-        # print("Getting board state...")
-        state_tensor = env.get_board_state()  # Assuming this returns a PyTorch tensor directly
-        state_tensor = torch.from_numpy(state_tensor).float()  # Convert NumPy array to PyTorch tensor and ensure float type
-        # print("Getting board state completed!")
+        # Positions seen before (in this or an earlier game) skip move generation and inference
+        cache_key = (env.board.hash, turn)
+        entry = position_cache.get(cache_key)
+        if entry is None:
+            state_tensor = env.get_board_state()
+            state_tensor = torch.from_numpy(state_tensor).float()  # Convert NumPy array to PyTorch tensor and ensure float type
+            with torch.no_grad():
+                model.eval()
+                output = model(state_tensor.unsqueeze(0))
+            entry = {'moves': env.get_legal_moves(turn), 'state': state_tensor, 'output': output}
+            position_cache.put(cache_key, entry)
+        state_tensor, output, legal_moves = entry['state'], entry['output'], entry['moves']
 
         with torch.no_grad():
-            # print("Getting move...")
-            model.eval()
-            output = model(state_tensor.unsqueeze(0))
-            # Filter out moves that lead to repetitive states
-            legal_moves = env.get_legal_moves(turn)
-            non_repetitive_moves = [move for move in legal_moves if move not in recent_moves]
+            # Filter out moves that lead back to a position already reached in this game
+            board = env.board
+            non_repetitive_moves = [move for move in legal_moves
+                                    if not board.repetition_count(board.hash_after(*move))]
             if non_repetitive_moves:
                 # Select the best move from non-repetitive legal moves
                 predicted_move_index = select_legal_move(output, non_repetitive_moves)
-                move = decode_move(predicted_move_index, env.board, non_repetitive_moves)
+                move = non_repetitive_moves[predicted_move_index]
                 success, _ = env.make_move(move, turn)
                 if success:
-                  recent_moves.append(move)  # Update game history with the successful move
                   data['states'].append(state_tensor.numpy())
-                  data['moves'].append(predicted_move_index)
+                  data['moves'].append(move_to_index(move))  # Target is the move's output index
                   total_moves += 1
                   game_moves += 1
 
@@ -98,25 +157,112 @@ def generate_self_play_data(model, games):
                 env.board.undo_move()
                 break
 
-        pygame.time.wait(constants.VISUAL_TIME)  # Slow down the visualization (milliseconds)
+        env.pause()  # Slow down the visualization
 
       print(f"Game {game_index}/{games} completed with {game_moves} moves.")
 
     avg_moves = total_moves // games if games > 0 else 0
     print(f"Generated {total_moves} total moves over {games} games (avg {avg_moves:.2f} moves/game).")
+    print(f"Position cache: {len(position_cache)} positions, {position_cache.hit_rate():.1%} hit rate.")
 
     return data
 
-model = ChessModel()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Self-play and train the chess model.")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Continue the run saved in {constants.CHECKPOINT_PATH} where it stopped.")
+    parser.add_argument("--pipeline", action="store_true", default=constants.PIPELINE,
+                        help="Train while self-play generates data, from a replay buffer (see replay.py).")
+    args = parser.parse_args(argv)
+    if args.resume and args.pipeline:
+        parser.error("--resume is not supported with --pipeline")
+
+    # Opt-in timers around move generation, encoding, the forward pass and drawing
+    session = instrument.Session(trace_path=constants.INSTRUMENT_TRACE, profile_path=constants.INSTRUMENT_PROFILE) \
+        if constants.INSTRUMENT else contextlib.nullcontext()
+    with session:
+        if args.pipeline:
+            run_pipelined()
+        else:
+            run(resume=args.resume)
+
+def run(resume=False):
+    """
+    Self-play constants.TRAIN_GAMES games, train on them and save the model.
+
+    Progress is checkpointed to constants.CHECKPOINT_PATH every constants.CHECKPOINT_INTERVAL
+    seconds, in the background (see checkpoint.py).
+
+    :param resume: Continue from the checkpoint instead of starting over.
+    """
+    model = ChessModel()
+    state = load_checkpoint(constants.CHECKPOINT_PATH) if resume else None
+    if resume and state is None:
+        print(f"No checkpoint at {constants.CHECKPOINT_PATH}, starting a new run.")
+    if state is not None:
+        model.load_state_dict(state['model'])
+        set_rng_state(state['rng'])
+        print(f"Resuming from the {state['stage']} stage of {constants.CHECKPOINT_PATH}.")
+
+    with Checkpointer(constants.CHECKPOINT_PATH, constants.CHECKPOINT_INTERVAL) as checkpointer:
+        def save(stage, selfplay_progress, trainer=None, optimizer=None, wait=False):
+            checkpointer.save({
+                'stage': stage,
+                'model': model.state_dict(),
+                'selfplay': selfplay_progress,
+                'trainer': dict(trainer, optimizer=optimizer.state_dict()) if trainer is not None else None,
+                'rng': rng_state(),
+            }, wait=wait)
+
+        if state is None or state['stage'] == "selfplay":
+            print("Self playing instantiating...")
+            # Initial self-play data generation, headless and spread over all cores
+            # (generate_self_play_data above plays visually in a single process).
+            # Positions are streamed to disk shards and memory-mapped for training.
+            progress = state['selfplay'] if state is not None else None
+
+            def on_selfplay_progress(current):
+                nonlocal progress
+                # A new run is checkpointed before its first game, so a resume always has a shard cursor
+                first = progress is None
+                progress = current
+                if first or checkpointer.due():
+                    save("selfplay", progress, wait=first)
+
+            selfplay.generate_self_play_data(model, constants.TRAIN_GAMES, workers=constants.SELF_PLAY_WORKERS,
+                                             shard_dir=constants.SELF_PLAY_DIR, resume=progress,
+                                             on_progress=on_selfplay_progress)
+            state = None
+            save("train", progress)
+        else:
+            progress = state['selfplay']
+        self_play_data = ShardDataset(constants.SELF_PLAY_DIR)
+
+        def on_train_progress(optimizer, trainer):
+            if checkpointer.due():
+                save("train", progress, trainer, optimizer)
+
+        if state is None or state['stage'] == "train":
+            print("Model training...")
+            # Train the model
+            train_model(model, epochs=constants.EPOCH, learning_rate=0.001, self_play_data=self_play_data,
+                        batch_size=constants.BATCH_SIZE, num_workers=constants.LOADER_WORKERS,
+                        augment=constants.AUGMENT, resume=state['trainer'] if state is not None else None,
+                        on_progress=on_train_progress)
 
-print("Self playing instantiating...")
-# Initial self-play data generation
-self_play_data = generate_self_play_data(model, constants.TRAIN_GAMES)
-pygame.quit()
+        # Save the trained model
+        write_atomic(model.state_dict(), 'trained_chess_model.pth')
+        save("done", progress, wait=True)
 
-print("Model training...")
-# Train the model
-train_model(model, epochs=constants.EPOCH, learning_rate=0.001, self_play_data=self_play_data)
+def run_pipelined():
+    """
+    Train for constants.PIPELINE_STEPS steps on a replay buffer that self-play worker processes
+    keep filling with the latest published weights, and save the model.
+    """
+    model = ChessModel()
+    print("Pipelined self-play and training...")
+    run_pipeline(model, constants.PIPELINE_STEPS, workers=constants.SELF_PLAY_WORKERS)
+    write_atomic(model.state_dict(), 'trained_chess_model.pth')
 
-# Save the trained model
-torch.save(model.state_dict(), 'trained_chess_model.pth')
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# training_data.py
+"""
+Minibatch input pipeline for train_model.
+
+Sources are datasets with a get_batch(indices) -> (states, moves) method:
+InMemoryChessData (contiguous tensors built once) or shards.ShardDataset
+(memory-mapped records decoded per batch). MinibatchDataset turns a source
+into a dataset of whole shuffled minibatches, so every DataLoader call
+(and every worker) produces a complete batch in one vectorized step.
+"""
+import math
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+# Channel permutation that swaps the white (0-5) and black (6-11) planes
+_COLOR_FLIP = [6, 7, 8, 9, 10, 11, 0, 1, 2, 3, 4, 5]
+
+
+class InMemoryChessData:
+    """(states, moves) held as two contiguous tensors, built once."""
+    def __init__(self, states, moves):
+        """
+        :param states: Array-like of shape (N, 12, 8, 8), e.g. a list of NumPy arrays.
+        :param moves: Array-like of N move indices.
+        """
+        self.states = torch.as_tensor(np.asarray(states, dtype=np.float32))
+        self.moves = torch.as_tensor(np.asarray(moves, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.moves)
+
+    def get_batch(self, indices):
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        return self.states[indices], self.moves[indices]
+
+
+def augment_batch(states, moves, probability=0.5, generator=None):
+    """
+    Apply the color flip + vertical mirror symmetry to a random subset of a batch.
+
+    Swapping the colors and mirroring the rows maps a position with one side
+    to move onto the equivalent position with the other side to move (pawn
+    directions and starting rows swap along with the colors), so the mirrored
+    move is exactly as good. Squares map (row, col) -> (7 - row, col).
+
+    :param states: Float tensor of shape (N, 12, 8, 8); modified in place.
+    :param moves: Long tensor of N move indices; modified in place.
+    :param probability: Chance for each sample to be flipped.
+    :return: The (states, moves) tensors.
+    """
+    flip = torch.rand(len(moves), generator=generator) < probability
+    if flip.any():
+        states[flip] = states[flip][:, _COLOR_FLIP].flip(2)
+        start, end = moves[flip] // 64, moves[flip] % 64
+        moves[flip] = (start ^ 56) * 64 + (end ^ 56)
+    return states, moves
+
+
+class MinibatchDataset(Dataset):
+    """Dataset whose items are whole minibatches of a source, reshuffled by set_epoch."""
+    def __init__(self, source, batch_size, shuffle=True, augment=False, seed=0):
+        self.source = source
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.augment = augment
+        self.seed = seed
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch, start=0):
+        """
+        Pick the sample order for an epoch; call before creating the epoch's iterator.
+
+        :param start: Skip the epoch's first `start` minibatches, e.g. to resume from a checkpoint.
+        """
+        self.epoch = epoch
+        self.start = start
+        if self.shuffle:
+            self.order = np.random.default_rng((self.seed, epoch)).permutation(len(self.source))
+        else:
+            self.order = np.arange(len(self.source))
+
+    def __len__(self):
+        return math.ceil(len(self.source) / self.batch_size) - self.start
+
+    def __getitem__(self, index):
+        index += self.start
+        indices = np.sort(self.order[index * self.batch_size:(index + 1) * self.batch_size])
+        states, moves = self.source.get_batch(indices)
+        if self.augment:
+            generator = torch.Generator().manual_seed(self.seed * 1000003 + self.epoch * 10007 + index)
+            states, moves = augment_batch(states, moves, generator=generator)
+        return states, moves
+
+
+def make_loader(source, batch_size=64, num_workers=0, pin_memory=None, prefetch_factor=2,
+                shuffle=True, augment=False, seed=0):
+    """
+    Build a prefetching DataLoader over whole minibatches of a source.
+
+    :param source: InMemoryChessData, ShardDataset or anything with get_batch and __len__.
+    :param num_workers: Worker processes decoding batches ahead of the training loop.
+    :param pin_memory: Pin batches for faster host-to-GPU copies; defaults to True when CUDA is available.
+    :param prefetch_factor: Batches each worker keeps ready.
+    :param augment: Apply augment_batch on the fly.
+    :return: A tuple (loader, minibatch dataset); call dataset.set_epoch(epoch) before each epoch.
+    """
+    dataset = MinibatchDataset(source, batch_size, shuffle=shuffle, augment=augment, seed=seed)
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+    kwargs = {"prefetch_factor": prefetch_factor} if num_workers > 0 else {}
+    loader = DataLoader(dataset, batch_size=None, shuffle=False, num_workers=num_workers,
+                        pin_memory=pin_memory, **kwargs)
+    return loader, dataset
@@ -0,0 +1,100 @@
+# vec_env.py
+import numpy as np
+import torch
+
+import constants
+from board import Board
+from encoder import encode_boards, move_to_index, index_to_move
+
+
+class VecChessEnv:
+    """
+    K chess games stepped in lockstep, for batched self-play.
+
+    Observations are stacked (K, 12, 8, 8) piece planes and actions are move
+    indices in [0, 4096) (see encoder.move_to_index), so one forward pass of
+    ChessModel serves every game. Finished games are reset automatically: the
+    observation returned for a game that just ended is the start position of
+    its next game.
+    """
+    def __init__(self, num_envs, max_plies=constants.MAX_GAME_PLIES, win_reward=1.0, illegal_reward=-0.1):
+        """
+        :param num_envs: Number of games K.
+        :param max_plies: Games are cut off (done) after this many plies.
+        :param win_reward: Added to the reward of the move that captures the opponent's king.
+        :param illegal_reward: Reward for an illegal action; the board is left unchanged.
+        """
+        self.num_envs = num_envs
+        self.max_plies = max_plies
+        self.win_reward = win_reward
+        self.illegal_reward = illegal_reward
+        self.boards = [Board() for _ in range(num_envs)]
+        self.plies = np.zeros(num_envs, dtype=np.int64)
+        self.legal_moves = [None] * num_envs
+        self._obs = torch.zeros((num_envs, 12, 8, 8), dtype=torch.float32)
+        self._mask = np.zeros((num_envs, 4096), dtype=bool)
+
+    def colors(self):
+        """Side to move in every game."""
+        return ["white" if board.white_turn else "black" for board in self.boards]
+
+    def reset(self):
+        """
+        Start every game from the initial position.
+
+        :return: A tuple (observations, legal-move mask) of shapes (K, 12, 8, 8) and (K, 4096).
+        """
+        self.boards = [Board() for _ in range(self.num_envs)]
+        self.plies[:] = 0
+        for k in range(self.num_envs):
+            self._update_legal_moves(k)
+        return self._observe()
+
+    def step(self, actions):
+        """
+        Play one move in every game.
+
+        :param actions: K move indices, as a sequence, NumPy array or tensor.
+        :return: A tuple (observations, legal-move mask, rewards, dones); rewards is a float32
+                 tensor and dones a bool tensor, both of shape (K,).
+        """
+        if self.legal_moves[0] is None:
+            raise RuntimeError("VecChessEnv.step() called before reset()")
+        actions = np.asarray(actions.cpu() if isinstance(actions, torch.Tensor) else actions, dtype=np.int64)
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+
+        for k, board in enumerate(self.boards):
+            action = int(actions[k])
+            if not self._mask[k, action]:
+                rewards[k] = self.illegal_reward
+                continue
+
+            captured = board.apply_move(*index_to_move(action))
+            self.plies[k] += 1
+            if captured is not None:
+                rewards[k] = captured.point
+            if board.is_game_over():
+                rewards[k] += self.win_reward
+                dones[k] = True
+            else:
+                self._update_legal_moves(k)
+                dones[k] = not self.legal_moves[k] or self.plies[k] >= self.max_plies
+
+            if dones[k]:
+                self.boards[k] = Board()
+                self.plies[k] = 0
+                self._update_legal_moves(k)
+
+        observations, mask = self._observe()
+        return observations, mask, torch.from_numpy(rewards), torch.from_numpy(dones)
+
+    def _update_legal_moves(self, k):
+        board = self.boards[k]
+        self.legal_moves[k] = board.get_all_legal_moves("white" if board.white_turn else "black")
+        self._mask[k] = False
+        self._mask[k, [move_to_index(move) for move in self.legal_moves[k]]] = True
+
+    def _observe(self):
+        encode_boards(self.boards, out=self._obs)
+        return self._obs.clone(), torch.from_numpy(self._mask.copy())
@@ -0,0 +1,44 @@
+# zobrist.py
+"""
+Zobrist keys for 64-bit position hashing.
+
+A position hash is the XOR of one key per (piece, square) plus keys for the
+side to move and castling rights. Board keeps its hash up to date
+incrementally as pieces are placed and removed, see Board._place.
+"""
+import random
+
+# Fixed seed so hashes are stable across runs and processes
+_rng = random.Random(0x5EED)
+
+# PIECE_KEYS[symbol][row * 8 + col]
+PIECE_KEYS = {symbol: [_rng.getrandbits(64) for _ in range(64)] for symbol in "PNBRQKpnbrqk"}
+BLACK_TO_MOVE_KEY = _rng.getrandbits(64)
+WHITE_CASTLE_KEY = _rng.getrandbits(64)
+BLACK_CASTLE_KEY = _rng.getrandbits(64)
+
+
+def state_key(white_turn, white_castle_king_side, black_castle_king_side):
+    """Hash contribution of the side to move and castling rights."""
+    key = 0 if white_turn else BLACK_TO_MOVE_KEY
+    if white_castle_king_side:
+        key ^= WHITE_CASTLE_KEY
+    if black_castle_king_side:
+        key ^= BLACK_CASTLE_KEY
+    return key
+
+
+def hash_board(board):
+    """
+    Compute the hash of a Board from scratch.
+
+    :param board: A Board instance.
+    :return: A 64-bit integer.
+    """
+    key = state_key(board.white_turn, board.white_castle_king_side, board.black_castle_king_side)
+    for row in range(8):
+        for col in range(8):
+            piece = board.board[row][col]
+            if piece is not None:
+                key ^= PIECE_KEYS[piece.symbol][row * 8 + col]
+    return key